@@ -0,0 +1,33 @@
+"""Added created_at to vinted_items and cascade to user_published_items
+
+Revision ID: 5f2c9a7e41d3
+Revises: 34abcdbe3bbf
+Create Date: 2026-10-18 11:02:47.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2c9a7e41d3'
+down_revision = '34abcdbe3bbf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('vinted_items', sa.Column('created_at', sa.DateTime(timezone=True),
+                                            server_default=sa.text('now()'), nullable=False))
+    op.create_index(op.f('ix_vinted_items_created_at'), 'vinted_items', ['created_at'], unique=False)
+    op.drop_constraint('user_published_items_item_id_fkey', 'user_published_items', type_='foreignkey')
+    op.create_foreign_key('user_published_items_item_id_fkey', 'user_published_items', 'vinted_items',
+                          ['item_id'], ['unique_id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    op.drop_constraint('user_published_items_item_id_fkey', 'user_published_items', type_='foreignkey')
+    op.create_foreign_key('user_published_items_item_id_fkey', 'user_published_items', 'vinted_items',
+                          ['item_id'], ['unique_id'])
+    op.drop_index(op.f('ix_vinted_items_created_at'), table_name='vinted_items')
+    op.drop_column('vinted_items', 'created_at')
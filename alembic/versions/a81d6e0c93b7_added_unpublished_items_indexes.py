@@ -0,0 +1,34 @@
+"""Added indexes for unpublished items queries
+
+Revision ID: a81d6e0c93b7
+Revises: 5f2c9a7e41d3
+Create Date: 2026-10-18 11:48:09.226415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81d6e0c93b7'
+down_revision = '5f2c9a7e41d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # user_published_items lookups by (user_id, item_id) are served by the user_item_unique constraint,
+    # user_categories lookups by user_id by its primary key.
+    # Built concurrently, outside the migration transaction, so ingest keeps writing to the tables meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index('ix_vinted_items_category_id_id', 'vinted_items', ['category_id', 'id'], unique=False,
+                        postgresql_concurrently=True)
+        op.create_index('ix_user_categories_category_id', 'user_categories', ['category_id'], unique=False,
+                        postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_categories_category_id', table_name='user_categories',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_vinted_items_category_id_id', table_name='vinted_items', postgresql_concurrently=True)
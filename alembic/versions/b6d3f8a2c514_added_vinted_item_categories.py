@@ -0,0 +1,40 @@
+"""Added vinted_item_categories
+
+Revision ID: b6d3f8a2c514
+Revises: e93f1a6b07c2
+Create Date: 2026-10-18 18:02:41.550218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3f8a2c514'
+down_revision = 'e93f1a6b07c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'vinted_item_categories',
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['saved_categories.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['item_id'], ['vinted_items.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('category_id', 'item_id'),
+    )
+    op.create_index(op.f('ix_vinted_item_categories_item_id'), 'vinted_item_categories', ['item_id'], unique=False)
+    op.execute(
+        'INSERT INTO vinted_item_categories (category_id, item_id) '
+        'SELECT category_id, id FROM vinted_items WHERE category_id IS NOT NULL'
+    )
+    # unpublished items are looked up through the links now
+    op.drop_index('ix_vinted_items_category_id_id', table_name='vinted_items')
+
+
+def downgrade() -> None:
+    op.create_index('ix_vinted_items_category_id_id', 'vinted_items', ['category_id', 'id'], unique=False)
+    op.drop_index(op.f('ix_vinted_item_categories_item_id'), table_name='vinted_item_categories')
+    op.drop_table('vinted_item_categories')
@@ -0,0 +1,25 @@
+"""Added last_delivered_item_id to user_categories
+
+Revision ID: c4e7b2d19f60
+Revises: a81d6e0c93b7
+Create Date: 2026-10-18 12:21:36.840572
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e7b2d19f60'
+down_revision = 'a81d6e0c93b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('user_categories', sa.Column('last_delivered_item_id', sa.Integer(),
+                                               server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user_categories', 'last_delivered_item_id')
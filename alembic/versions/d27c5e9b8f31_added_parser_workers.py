@@ -0,0 +1,29 @@
+"""Added parser_workers
+
+Revision ID: d27c5e9b8f31
+Revises: b6d3f8a2c514
+Create Date: 2026-10-18 18:21:07.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd27c5e9b8f31'
+down_revision = 'b6d3f8a2c514'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'parser_workers',
+        sa.Column('worker_id', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('worker_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('parser_workers')
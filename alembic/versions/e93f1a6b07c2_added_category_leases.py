@@ -0,0 +1,33 @@
+"""Added category_leases
+
+Revision ID: e93f1a6b07c2
+Revises: c4e7b2d19f60
+Create Date: 2026-10-18 13:05:12.418390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93f1a6b07c2'
+down_revision = 'c4e7b2d19f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'category_leases',
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['saved_categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('category_id'),
+    )
+    op.create_index(op.f('ix_category_leases_worker_id'), 'category_leases', ['worker_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_category_leases_worker_id'), table_name='category_leases')
+    op.drop_table('category_leases')
@@ -0,0 +1,32 @@
+"""Added pending to vinted_item_categories
+
+Revision ID: f3b8e1d64a07
+Revises: d27c5e9b8f31
+Create Date: 2026-10-18 19:04:52.117340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8e1d64a07'
+down_revision = 'd27c5e9b8f31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing links are not pending, they were delivered by the previous tail or are listed as unpublished
+    op.add_column('vinted_item_categories',
+                  sa.Column('pending', sa.Boolean(), server_default=sa.false(), nullable=False))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_vinted_item_categories_pending', 'vinted_item_categories', ['item_id'], unique=False,
+                        postgresql_where=sa.text('pending'), postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_vinted_item_categories_pending', table_name='vinted_item_categories',
+                      postgresql_concurrently=True)
+    op.drop_column('vinted_item_categories', 'pending')
@@ -0,0 +1,173 @@
+"""
+Benchmark of the delivery path against the local fake Telegram Bot API and a throwaway Postgres database.
+
+A fresh database is seeded with --users active users subscribed to one category with --items unpublished items.
+A separate process then runs send_new_items_to_user for every user at once,
+through the sender and the published item writer, with the bot pointed at the fake server.
+
+Reported:
+- messages/s: acknowledged bot api calls per second, an album counts as one call
+- items/s: delivered items per second
+- latency: p50/p90/p99 from the start of delivery to the acknowledgement of each call, retries included
+- commits per message: database commits per acknowledged call, reads and published item writes included
+
+Usage: python -m benchmarks.bench_delivery [--users 100] [--items 50] [--latency 0.05] [--flood-rate 0.01]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from decouple import config
+from sqlalchemy import create_engine, event
+
+from benchmarks.database import database_url, throwaway_database
+from benchmarks.payloads import catalog_item
+from benchmarks.servers import start_server
+
+BENCHMARK_TOKEN = '123456:benchmark'
+
+
+def percentile(values: list[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def seed(users: int, items: int):
+    from src.db_client.models import Base, Category, TelegramBotUser, UserCategory, VintedItem, VintedItemCategory
+
+    engine = create_engine(database_url(config('DB_NAME')))
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Category.__table__.insert(), [{'id': 1, 'name': 'benchmark category'}])
+        connection.execute(TelegramBotUser.__table__.insert(), [
+            {'id': user_id, 'username': f'user{user_id}', 'first_name': 'Benchmark', 'active': True}
+            for user_id in range(1, users + 1)
+        ])
+        connection.execute(UserCategory.__table__.insert(), [
+            {'user_id': user_id, 'category_id': 1} for user_id in range(1, users + 1)
+        ])
+        rows = []
+        for item_id in range(1, items + 1):
+            item = catalog_item(item_id)
+            rows.append({
+                'title': item['title'],
+                'unique_id': item['id'],
+                'price': item['price'],
+                'brand_name': item['brand_title'],
+                'size': item['size_title'],
+                'url': item['url'],
+                'image_url': item['photo']['url'],
+                'category_id': 1,
+            })
+        item_ids = connection.execute(VintedItem.__table__.insert().returning(VintedItem.id), rows).scalars()
+        connection.execute(VintedItemCategory.__table__.insert(), [
+            {'item_id': item_id, 'category_id': 1} for item_id in item_ids
+        ])
+    engine.dispose()
+
+
+async def deliver(users: int) -> dict:
+    from src.tg_bot.bot import bot
+    from src.tg_bot.db_handler import published_item_writer, session_manager
+    from src.tg_bot.sender import sender
+    from src.tg_bot.utils import send_new_items_to_user
+
+    commits = 0
+
+    def count_commit(*_):
+        nonlocal commits
+        commits += 1
+
+    event.listen(session_manager.async_engine.sync_engine, 'commit', count_commit)
+
+    acknowledged_at = []
+    send = sender.send
+
+    async def timed_send(method, chat_id, **kwargs):
+        result = await send(method, chat_id, **kwargs)
+        acknowledged_at.append(time.perf_counter())
+        return result
+
+    sender.send = timed_send
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send_new_items_to_user(user_id) for user_id in range(1, users + 1)))
+    await published_item_writer.close()
+    total_time = time.perf_counter() - start
+
+    await sender.on_shutdown(None)
+    await (await bot.get_session()).close()
+
+    latencies = [acknowledged - start for acknowledged in acknowledged_at]
+    return {
+        'messages': len(acknowledged_at),
+        'total_time': total_time,
+        'latencies': latencies,
+        'commits': commits,
+    }
+
+
+def worker(args):
+    """
+    Seeds the database and runs the delivery in this process, the database and TG_API_SERVER are set by the parent
+    """
+    seed(args.users, args.items)
+    result = asyncio.run(deliver(args.users))
+    latencies = result.pop('latencies')
+    print(json.dumps({
+        **result,
+        'items': args.users * args.items,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+    }))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--users', type=int, default=100)
+    arg_parser.add_argument('--items', type=int, default=50, help='unpublished items per user')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds, fake server response delay')
+    arg_parser.add_argument('--chat-rate', type=float, default=0, help='messages per second per chat, 0 disables')
+    arg_parser.add_argument('--flood-rate', type=float, default=0.01, help='share of requests answered with 429')
+    arg_parser.add_argument('--port', type=int, default=8766)
+    arg_parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    server = start_server(
+        'benchmarks.fake_telegram', args.port,
+        '--latency', str(args.latency), '--chat-rate', str(args.chat_rate), '--flood-rate', str(args.flood_rate),
+    )
+    try:
+        with throwaway_database('delivery_bench') as name:
+            env = dict(os.environ, DB_NAME=name, API_TOKEN=BENCHMARK_TOKEN,
+                       TG_API_SERVER=f'http://127.0.0.1:{args.port}')
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_delivery', '--worker',
+                 '--users', str(args.users), '--items', str(args.items)],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f'users: {args.users}, items per user: {args.items}, latency: {args.latency}s, '
+          f'flood rate: {args.flood_rate}')
+    print(f'messages:            {r["messages"]:>10}')
+    print(f'messages/s:          {r["messages"] / r["total_time"]:>10,.1f}')
+    print(f'items/s:             {r["items"] / r["total_time"]:>10,.1f}')
+    print(f'latency p50/p90/p99: {r["p50"]:.2f}s / {r["p90"]:.2f}s / {r["p99"]:.2f}s')
+    print(f'commits per message: {r["commits"] / max(r["messages"], 1):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
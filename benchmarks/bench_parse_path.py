@@ -0,0 +1,89 @@
+"""
+Benchmark of the parse path: raw catalog response -> Item objects -> rows for the insert statement.
+
+Compares the previous path (stdlib json decoder, regular dataclass, dataclasses.asdict)
+with the current one (src.json_backend decoder, slotted Item, Item.as_dict).
+
+Usage: python -m benchmarks.bench_parse_path [--responses 2000] [--per-page 96]
+"""
+import argparse
+import json
+import time
+from dataclasses import asdict, dataclass
+
+from benchmarks.payloads import catalog_page
+from src.data_structures import Item
+from src.json_backend import JSON_BACKEND, loads
+
+
+@dataclass
+class LegacyItem:
+    """
+    Item as it was declared before it got slots
+    """
+    title: str = None
+    unique_id: int = None
+    price: float = None
+    brand_name: str = None
+    size: str = None
+    url: str = None
+    image_url: str = None
+    category_id: int = None
+
+
+def get_item(item_cls, item: dict, category_id: int):
+    """
+    Same field extraction as VintedParser._get_item
+    """
+    return item_cls(
+        title=item['title'],
+        unique_id=item['id'],
+        price=item['price'],
+        brand_name=item['brand_title'],
+        size=item['size_title'],
+        url=item['url'],
+        image_url=item['photo']['url'],
+        category_id=category_id,
+    )
+
+
+def legacy_path(body: bytes) -> list[dict]:
+    items = json.loads(body)['items']
+    return [asdict(get_item(LegacyItem, item, 1)) for item in items]
+
+
+def current_path(body: bytes) -> list[dict]:
+    items = loads(body)['items']
+    return [get_item(Item, item, 1).as_dict() for item in items]
+
+
+def measure(path, bodies: list[bytes]) -> float:
+    start = time.perf_counter()
+    items = 0
+    for body in bodies:
+        items += len(path(body))
+    return items / (time.perf_counter() - start)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--responses', type=int, default=2000)
+    arg_parser.add_argument('--per-page', type=int, default=96)
+    args = arg_parser.parse_args()
+
+    bodies = [
+        json.dumps(catalog_page(10 ** 9 + i * args.per_page, args.per_page)).encode()
+        for i in range(args.responses)
+    ]
+    assert legacy_path(bodies[0]) == current_path(bodies[0])
+
+    legacy = measure(legacy_path, bodies)
+    current = measure(current_path, bodies)
+    print(f'responses: {args.responses} x {args.per_page} items, json backend: {JSON_BACKEND}')
+    print(f'legacy  (json + dataclass + asdict): {legacy:12,.0f} items/s')
+    print(f'current ({JSON_BACKEND} + slots + as_dict): {current:12,.0f} items/s')
+    print(f'speedup: {current / legacy:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+End to end benchmark of VintedParser against the local fake vinted server and a throwaway Postgres database.
+
+For every category count a fresh database is created on the server from the DB_* settings,
+filled with the categories and polled for --cycles cycles by a separate process.
+The first cycle is cold (no high-water marks), the next ones only fetch the items that arrived in between.
+
+Reported per category count:
+- items/s: new items stored per second of cycle time
+- cycle time: cold cycle and mean of the warm ones
+- db share: part of the cycle time spent in database calls
+- peak rss: maximum resident set size of the parser process
+
+Usage: python -m benchmarks.bench_parser [--sizes 10 100 1000] [--cycles 5] [--latency 0.05] [--error-rate 0.0]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from decouple import config
+from sqlalchemy import create_engine
+
+from benchmarks.database import database_url, throwaway_database
+from benchmarks.servers import start_server
+
+
+def run_size(args, categories: int) -> dict:
+    """
+    Creates a throwaway database, runs the worker process against it and drops it
+    """
+    with throwaway_database(f'vinted_bench_{categories}') as name:
+        env = dict(os.environ, DB_NAME=name, VINTED_URL=f'http://127.0.0.1:{args.port}')
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_parser', '--worker',
+             '--categories', str(categories), '--cycles', str(args.cycles),
+             '--cycle-interval', str(args.cycle_interval)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def worker(args):
+    """
+    Runs the parser in this process, the database and VINTED_URL are set by the parent
+    """
+    from src.db_client.models import Base, Category
+
+    engine = create_engine(database_url(config('DB_NAME')))
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Category.__table__.insert(), [
+            {'name': f'benchmark category {i}'} for i in range(args.categories)
+        ])
+    engine.dispose()
+
+    from src.parsers.parser_vinted import vinted
+
+    db_time = 0.0
+    run_db = vinted._run_db
+
+    def timed(func):
+        def wrapper(*func_args):
+            nonlocal db_time
+            start = time.perf_counter()
+            try:
+                return func(*func_args)
+            finally:
+                db_time += time.perf_counter() - start
+        return wrapper
+
+    vinted._run_db = lambda func, *func_args: run_db(timed(func), *func_args)
+
+    cycle_times = []
+    items = requests = 0
+    for cycle in range(args.cycles):
+        if cycle:
+            time.sleep(args.cycle_interval)
+        start = time.perf_counter()
+        results = vinted()
+        cycle_times.append(time.perf_counter() - start)
+        items += sum(result.new_items for result in results.values())
+        requests += sum(result.requests for result in results.values())
+    vinted.close()
+
+    total_time = sum(cycle_times)
+    warm = cycle_times[1:] or cycle_times
+    print(json.dumps({
+        'categories': args.categories,
+        'items': items,
+        'requests': requests,
+        'items_per_second': items / total_time,
+        'cold_cycle': cycle_times[0],
+        'warm_cycle': sum(warm) / len(warm),
+        'db_share': db_time / total_time,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help='category counts')
+    arg_parser.add_argument('--cycles', type=int, default=5)
+    arg_parser.add_argument('--cycle-interval', type=float, default=5, help='seconds between cycles')
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds, fake server response delay')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    arg_parser.add_argument('--arrival-rate', type=float, default=1.0, help='new items per second per category')
+    arg_parser.add_argument('--port', type=int, default=8765)
+    arg_parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    arg_parser.add_argument('--categories', type=int, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    server = start_server(
+        'benchmarks.fake_vinted', args.port,
+        '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--arrival-rate', str(args.arrival_rate),
+    )
+    try:
+        print(f'latency: {args.latency}s, error rate: {args.error_rate}, cycles: {args.cycles}')
+        print(f'{"categories":>10} {"items":>8} {"requests":>9} {"items/s":>10} {"cold cycle":>11} '
+              f'{"warm cycle":>11} {"db share":>9} {"peak rss":>10}')
+        for size in args.sizes:
+            r = run_size(args, size)
+            print(f'{r["categories"]:>10} {r["items"]:>8} {r["requests"]:>9} {r["items_per_second"]:>10,.0f} '
+                  f'{r["cold_cycle"]:>10.2f}s {r["warm_cycle"]:>10.2f}s {r["db_share"]:>9.0%} '
+                  f'{r["peak_rss_mb"]:>8.0f}MB')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    main()
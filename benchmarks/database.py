@@ -0,0 +1,32 @@
+"""
+This module contains helpers for the throwaway databases used by the benchmarks
+"""
+import os
+from contextlib import contextmanager
+
+from decouple import config
+from sqlalchemy import create_engine, text
+
+
+def database_url(name: str) -> str:
+    return f"postgresql://{config('DB_USER')}:{config('DB_PASSWORD')}@" \
+           f"{config('DB_HOST')}:{config('DB_PORT')}/{name}"
+
+
+@contextmanager
+def throwaway_database(prefix: str):
+    """
+    Creates a database on the server from the DB_* settings and drops it on exit
+    :param prefix: prefix of the database name
+    :return: name of the database
+    """
+    name = f'{prefix}_{os.getpid()}'
+    admin_engine = create_engine(database_url(config('DB_NAME')), isolation_level='AUTOCOMMIT')
+    with admin_engine.connect() as connection:
+        connection.execute(text(f'CREATE DATABASE {name}'))
+    try:
+        yield name
+    finally:
+        with admin_engine.connect() as connection:
+            connection.execute(text(f'DROP DATABASE IF EXISTS {name} WITH (FORCE)'))
+        admin_engine.dispose()
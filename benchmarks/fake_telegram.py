@@ -0,0 +1,109 @@
+"""
+Local fake of the Telegram Bot API methods used by the delivery path.
+
+- sendMessage, sendPhoto and sendMediaGroup return messages shaped like the real ones
+- getMe returns the bot user
+
+Responses are delayed by --latency seconds. A chat that gets more than --chat-rate messages per second,
+or a request picked at --flood-rate, is answered with 429 and retry_after of --retry-after seconds.
+
+Usage: python -m benchmarks.fake_telegram [--port 8766] [--latency 0.05] [--chat-rate 0] [--flood-rate 0.01]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+
+
+class FakeTelegram:
+    def __init__(self, latency: float, chat_rate: float, flood_rate: float, retry_after: int):
+        self.latency = latency
+        self.chat_rate = chat_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.last_sent: dict[int, float] = {}
+        self.message_id = 0
+        self.sent = 0
+        self.flood_errors = 0
+
+    def _message(self, chat_id: int, **fields) -> dict:
+        self.message_id += 1
+        return {
+            'message_id': self.message_id,
+            'from': BOT_USER,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': int(time.time()),
+            **fields,
+        }
+
+    def _is_flooded(self, chat_id: int) -> bool:
+        now = time.monotonic()
+        last_sent = self.last_sent.get(chat_id)
+        if random.random() < self.flood_rate or \
+                (self.chat_rate and last_sent is not None and now - last_sent < 1 / self.chat_rate):
+            return True
+        self.last_sent[chat_id] = now
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        method = request.match_info['method']
+        params = await request.post()
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': BOT_USER})
+
+        chat_id = int(params['chat_id'])
+        if self._is_flooded(chat_id):
+            self.flood_errors += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+
+        photo = [{'file_id': 'benchmark', 'file_unique_id': 'benchmark', 'width': 600, 'height': 800}]
+        if method == 'sendMessage':
+            result = self._message(chat_id, text=params.get('text', ''))
+        elif method == 'sendPhoto':
+            result = self._message(chat_id, photo=photo, caption=params.get('caption', ''))
+        elif method == 'sendMediaGroup':
+            media = json.loads(params['media'])
+            result = [self._message(chat_id, photo=photo, caption=item.get('caption', '')) for item in media]
+        else:
+            return web.json_response({'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404)
+        self.sent += 1
+        return web.json_response({'ok': True, 'result': result})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'sent': self.sent, 'flood_errors': self.flood_errors})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/stats', self.stats)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8766)
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds')
+    arg_parser.add_argument('--chat-rate', type=float, default=0, help='messages per second per chat, 0 disables')
+    arg_parser.add_argument('--flood-rate', type=float, default=0.01, help='share of requests answered with 429')
+    arg_parser.add_argument('--retry-after', type=int, default=1, help='seconds')
+    args = arg_parser.parse_args()
+
+    fake = FakeTelegram(args.latency, args.chat_rate, args.flood_rate, args.retry_after)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
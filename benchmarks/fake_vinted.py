@@ -0,0 +1,96 @@
+"""
+Local fake of the vinted.pl endpoints used by the parser.
+
+- POST /auth/token_refresh sets a session cookie
+- GET /api/v2/catalog/items returns catalog pages ordered from newest to oldest
+
+Every search text gets its own id range, new listings arrive at --arrival-rate items per second per search text.
+Responses are delayed by --latency seconds and fail with 503 at --error-rate.
+
+Usage: python -m benchmarks.fake_vinted [--port 8765] [--latency 0.05] [--error-rate 0.0] [--arrival-rate 1.0]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+from benchmarks.payloads import catalog_item
+
+ID_RANGE = 10 ** 7  # ids reserved for every search text
+INITIAL_ITEMS = 10 ** 4  # listings present in every catalog at startup
+
+
+class FakeVinted:
+    def __init__(self, latency: float, error_rate: float, arrival_rate: float, total_pages: int):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.arrival_rate = arrival_rate
+        self.total_pages = total_pages
+        self.started_at = time.monotonic()
+        self.search_texts: dict[str, int] = {}
+        self.requests = 0
+
+    def newest_item_id(self, search_text: str) -> int:
+        base = self.search_texts.setdefault(search_text, len(self.search_texts) + 1) * ID_RANGE
+        return base + INITIAL_ITEMS + int((time.monotonic() - self.started_at) * self.arrival_rate)
+
+    async def _respond(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise web.HTTPServiceUnavailable()
+
+    async def token_refresh(self, request: web.Request) -> web.Response:
+        await self._respond()
+        response = web.Response(text='{}', content_type='application/json')
+        response.set_cookie('_vinted_fr_session', f'benchmark-{self.requests}', max_age=3600)
+        return response
+
+    async def catalog_items(self, request: web.Request) -> web.Response:
+        await self._respond()
+        page = int(request.query.get('page', 1))
+        per_page = int(request.query.get('per_page', 96))
+        first_id = self.newest_item_id(request.query.get('search_text', '')) - (page - 1) * per_page
+        body = {
+            'items': [catalog_item(item_id) for item_id in range(first_id, first_id - per_page, -1)],
+            'pagination': {
+                'current_page': page,
+                'total_pages': self.total_pages,
+                'total_entries': self.total_pages * per_page,
+                'per_page': per_page,
+            },
+            'code': 0,
+        }
+        return web.Response(text=json.dumps(body), content_type='application/json')
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({'requests': self.requests, 'search_texts': len(self.search_texts)})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/auth/token_refresh', self.token_refresh)
+        app.router.add_get('/api/v2/catalog/items', self.catalog_items)
+        app.router.add_get('/stats', self.stats)
+        return app
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8765)
+    arg_parser.add_argument('--latency', type=float, default=0.05, help='seconds')
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    arg_parser.add_argument('--arrival-rate', type=float, default=1.0, help='new items per second per search text')
+    arg_parser.add_argument('--total-pages', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    fake = FakeVinted(args.latency, args.error_rate, args.arrival_rate, args.total_pages)
+    web.run_app(fake.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+This module generates catalog/items responses shaped like the ones returned by vinted.pl
+"""
+import random
+
+BRANDS = ['Nike', 'Adidas', 'Zara', 'H&M', 'Levi\'s', 'Ralph Lauren', 'Tommy Hilfiger', 'Reserved']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', '38', '40', '42', '44']
+
+
+def catalog_item(item_id: int) -> dict:
+    """
+    Returns one listing with the fields the parser reads and the noise around them
+    """
+    brand = random.choice(BRANDS)
+    photo_url = f'https://images1.vinted.net/t/{item_id}/f800/{item_id}.jpeg'
+    return {
+        'id': item_id,
+        'title': f'{brand} item {item_id}',
+        'price': f'{random.randint(5, 500)}.0',
+        'discount': None,
+        'currency': 'PLN',
+        'brand_title': brand,
+        'size_title': random.choice(SIZES),
+        'url': f'https://www.vinted.pl/items/{item_id}-{brand.lower()}-item',
+        'is_visible': 1,
+        'promoted': False,
+        'favourite_count': random.randint(0, 50),
+        'is_favourite': False,
+        'badge': None,
+        'conversion': None,
+        'service_fee': f'{random.randint(1, 20)}.5',
+        'total_item_price': f'{random.randint(10, 520)}.5',
+        'view_count': random.randint(0, 1000),
+        'user': {
+            'id': random.randint(1, 10 ** 8),
+            'login': f'user{random.randint(1, 10 ** 6)}',
+            'profile_url': 'https://www.vinted.pl/member/1',
+            'photo': None,
+            'business': False,
+        },
+        'photo': {
+            'id': item_id * 10,
+            'image_no': 1,
+            'width': 600,
+            'height': 800,
+            'dominant_color': '#A5A5A5',
+            'dominant_color_opaque': '#E4E4E4',
+            'url': photo_url,
+            'is_main': True,
+            'thumbnails': [
+                {'type': thumbnail, 'url': photo_url, 'width': 150, 'height': 210, 'original_size': None}
+                for thumbnail in ('thumb70x100', 'thumb150x210', 'thumb310x430', 'thumb428x624', 'thumb364x428')
+            ],
+            'high_resolution': {'id': f'{item_id}', 'timestamp': 1680000000, 'orientation': None},
+            'is_suspicious': False,
+            'full_size_url': photo_url,
+            'is_hidden': False,
+        },
+    }
+
+
+def catalog_page(first_id: int, per_page: int, total_pages: int = 100, page: int = 1) -> dict:
+    """
+    Returns a catalog page with items ordered from newest to oldest, starting at first_id
+    """
+    return {
+        'items': [catalog_item(item_id) for item_id in range(first_id, first_id - per_page, -1)],
+        'dominant_brand': None,
+        'search_tracking_params': {'search_correlation_id': 'benchmark', 'search_session_id': 'benchmark'},
+        'pagination': {
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_entries': total_pages * per_page,
+            'per_page': per_page,
+            'time': 1680000000,
+        },
+        'code': 0,
+    }
@@ -0,0 +1,27 @@
+"""
+This module starts the fake upstream servers used by the benchmarks
+"""
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def start_server(module: str, port: int, *options: str) -> subprocess.Popen:
+    """
+    Starts a fake server module in a separate process and waits until it answers on /stats
+    :param module: module name, e.g. benchmarks.fake_vinted
+    :param port: port the server listens on
+    :param options: extra command line options of the server
+    """
+    server = subprocess.Popen([sys.executable, '-m', module, '--port', str(port), *options])
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/stats', timeout=1)
+            return server
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError(f'{module} did not start')
+            time.sleep(0.1)
@@ -4,7 +4,7 @@ This module contains dataclasses for vinted.pl and grailed.com
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class Item:
     """
     Dataclass for parsed item
@@ -17,3 +17,38 @@ class Item:
     url: str = None
     image_url: str = None
     category_id: int = None
+
+    def as_dict(self) -> dict:
+        """
+        Shallow dict of the item, cheaper than dataclasses.asdict which copies recursively
+        """
+        return {
+            "title": self.title,
+            "unique_id": self.unique_id,
+            "price": self.price,
+            "brand_name": self.brand_name,
+            "size": self.size,
+            "url": self.url,
+            "image_url": self.image_url,
+            "category_id": self.category_id,
+        }
+
+
+@dataclass
+class PollResult:
+    """
+    Dataclass for the outcome of polling one category
+    """
+    category_id: int
+    new_items: int = 0
+    requests: int = 0
+    skipped: bool = False  # not polled because vinted is unavailable
+
+
+@dataclass(frozen=True)
+class CategoryQuery:
+    """
+    Dataclass for a normalized catalog search, equivalent categories share one query
+    """
+    search_text: str
+    brand_id: int = None
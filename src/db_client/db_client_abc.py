@@ -1,10 +1,10 @@
 from abc import ABC, abstractmethod
 from sqlalchemy import create_engine
-from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from decouple import config
 from ..settings import DEBUG
+from ..tracing import trace_engine
 from .models import Category
 
 Base = declarative_base()
@@ -26,6 +26,7 @@ class ParserDbClientABC(ABC):
             max_overflow=20,  # Allow up to 20 additional connections to be created if needed
         )
 
+        trace_engine(self._engine)
         Base.metadata.create_all(self._engine)
 
         self._session_factory = scoped_session(
@@ -34,10 +35,7 @@ class ParserDbClientABC(ABC):
         )
 
         if DEBUG:
-            try:
-                self.clear_table()
-            except ProgrammingError:
-                self._create_table()
+            self._create_table()
 
     def _get_scopefunc(self):
         """
@@ -49,15 +47,12 @@ class ParserDbClientABC(ABC):
     def _create_table(self):
         pass
 
-    @abstractmethod
-    def clear_table(self):
-        pass
-
     @abstractmethod
     def insert_items(self, items):
         """
         Inserts item to database
         :param items:
+        :return: (unique_id, category_id) of the items that were new to their category
         """
         return
 
@@ -1,15 +1,34 @@
 """
 This module contains VintedDBManager class
 """
-from dataclasses import asdict
+import datetime
+import io
+from typing import Optional
 
 from sqlalchemy.dialects.postgresql import insert as pg_insert
-from sqlalchemy.exc import ProgrammingError
-from sqlalchemy import and_, select
+from sqlalchemy import BigInteger, Integer, column, delete, func, literal, or_, select, table, text, update, values
 
 from ..data_structures import Item
+from ..metrics import db_items_inserted_total, db_items_offered_total
+from ..settings import PARSER_IN_PROCESS, VINTED_BULK_INGEST_MODE, VINTED_ITEMS_PRUNE_BATCH_SIZE
 from .db_client_abc import ParserDbClientABC
 from .models import *
+from .seen_ids import SeenIdCache, seen_ids
+
+ITEM_COLUMNS = ('title', 'unique_id', 'price', 'brand_name', 'size', 'url', 'image_url', 'category_id')
+
+STAGING_TABLE = 'vinted_items_staging'
+
+PRUNE_LOCK_KEY = 0x76696e74  # postgres advisory lock held by the process that prunes vinted_items
+
+
+def _copy_value(value) -> str:
+    """
+    Formats a value for COPY in text format
+    """
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
 
 
 class VintedDbClient(ParserDbClientABC):
@@ -22,34 +41,182 @@ class VintedDbClient(ParserDbClientABC):
         self._reference = 'vinted'
         self._initialize_session()
 
-    def insert_items(self, items: list[Item]):
-        dicts = [asdict(item) for item in items]
-        stmt = pg_insert(VintedItem).values(dicts).on_conflict_do_nothing()
-        self._session.execute(stmt)
-        self._session.commit()
+    def insert_items(self, items: list[Item]) -> set[tuple[int, int]]:
+        """
+        Inserts items, links them to the categories they were fetched for
+        and moves the high-water mark of the categories in the same transaction.
+        An item fetched for several equivalent categories is passed once per category and stored once.
+        :param items: list[Item]
+        :return: set[tuple[int, int]], (unique_id, category_id) of the items that were new to their category
+        """
+        try:
+            if VINTED_BULK_INGEST_MODE == 'copy':
+                inserted_ids, links = self._copy_items(items)
+            else:
+                inserted_ids, links = self._insert_items(items)
+            linked = self._link_items(links)
+
+            newest_item_ids = {}
+            for item in items:
+                newest_item_ids[item.category_id] = max(item.unique_id, newest_item_ids.get(item.category_id, 0))
+            for category_id, newest_item_id in newest_item_ids.items():
+                self._session.execute(
+                    update(Category)
+                    .where(Category.id == category_id)
+                    .values(newest_item_id=func.greatest(func.coalesce(Category.newest_item_id, 0), newest_item_id))
+                )
+
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        seen_ids.add(item.unique_id for item in items)
+        db_items_offered_total.inc(len(items))
+        db_items_inserted_total.inc(len(inserted_ids))
+        return linked
 
-    def clear_table(self):
+    def _insert_items(self, items: list[Item]):
         """
-        Clears table
-        :return:
+        Inserts items with one multi-row INSERT
+        :return: unique ids of the inserted items and a selectable of (unique_id, category_id) pairs to link
         """
-        UserPublishedItem.__table__.drop(self._engine, checkfirst=True)
-        VintedItem.__table__.drop(self._engine, checkfirst=True)
-        self._create_table()
+        rows = {}
+        for item in sorted(items, key=lambda item: item.category_id):
+            rows.setdefault(item.unique_id, item.as_dict())
+        stmt = (
+            pg_insert(VintedItem)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing()
+            .returning(VintedItem.unique_id)
+        )
+        inserted_ids = list(self._session.scalars(stmt))
+        links = values(column('unique_id', BigInteger), column('category_id', Integer), name='links').data(
+            list({(item.unique_id, item.category_id) for item in items})
+        )
+        return inserted_ids, links
 
-    def _create_table(self):
-        VintedItem.__table__.create(self._engine)
-        UserPublishedItem.__table__.create(self._engine)
+    def _copy_items(self, items: list[Item]):
+        """
+        Streams items into a temporary staging table with COPY and merges them with one INSERT ... SELECT.
+        The staging table lives as long as the connection and is emptied on commit.
+        :return: unique ids of the inserted items and the staging table, which holds the pairs to link
+        """
+        columns = ', '.join(ITEM_COLUMNS)
+        self._session.execute(text(
+            f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ('
+            f'title varchar(255), unique_id bigint, price numeric(10, 3), brand_name varchar(255), '
+            f'size varchar(50), url text, image_url text, category_id integer'
+            f') ON COMMIT DELETE ROWS'
+        ))
+
+        buffer = io.StringIO()
+        for item in items:
+            row = item.as_dict()
+            buffer.write('\t'.join(_copy_value(row[column]) for column in ITEM_COLUMNS))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor = self._session.connection().connection.cursor()
         try:
-            Category.__table__.create(self._engine)
-        except ProgrammingError:
-            pass
+            cursor.copy_expert(f'COPY {STAGING_TABLE} ({columns}) FROM STDIN', buffer)
+        finally:
+            cursor.close()
+
+        result = self._session.execute(text(
+            f'INSERT INTO {VintedItem.__tablename__} ({columns}) '
+            f'SELECT DISTINCT ON (unique_id) {columns} FROM {STAGING_TABLE} ORDER BY unique_id, category_id '
+            f'ON CONFLICT DO NOTHING RETURNING unique_id'
+        ))
+        staging = table(STAGING_TABLE, column('unique_id', BigInteger), column('category_id', Integer))
+        return list(result.scalars()), staging
+
+    def _link_items(self, links) -> set[tuple[int, int]]:
+        """
+        Links stored items to categories, existing links are kept.
+        New links are left pending for the bot when the parser runs out of its process.
+        :param links: selectable with unique_id and category_id columns
+        :return: set[tuple[int, int]], (unique_id, category_id) of the new links
+        """
+        linked = (
+            pg_insert(VintedItemCategory)
+            .from_select(
+                ['item_id', 'category_id', 'pending'],
+                select(VintedItem.id, links.c.category_id, literal(not PARSER_IN_PROCESS))
+                .join(links, VintedItem.unique_id == links.c.unique_id),
+            )
+            .on_conflict_do_nothing()
+            .returning(VintedItemCategory.item_id, VintedItemCategory.category_id)
+            .cte('linked')
+        )
+        rows = self._session.execute(
+            select(VintedItem.unique_id, linked.c.category_id).join(linked, VintedItem.id == linked.c.item_id)
+        )
+        return {(unique_id, category_id) for unique_id, category_id in rows}
+
+    def _create_table(self):
+        Category.__table__.create(self._engine, checkfirst=True)
+        VintedItem.__table__.create(self._engine, checkfirst=True)
+        VintedItemCategory.__table__.create(self._engine, checkfirst=True)
+        UserPublishedItem.__table__.create(self._engine, checkfirst=True)
+        CategoryLease.__table__.create(self._engine, checkfirst=True)
+        ParserWorker.__table__.create(self._engine, checkfirst=True)
+
+    def prune_items(self, older_than: datetime.datetime, batch_size: int = VINTED_ITEMS_PRUNE_BATCH_SIZE) -> Optional[int]:
+        """
+        Deletes items ingested before the given time, batch_size rows per transaction,
+        so the table is never locked for long. Published records of the items are deleted by cascade.
+        High-water marks of categories are kept, so pruned items are not ingested again.
+        Only one process prunes at a time, the others skip the run while it holds the prune lock.
+        :param older_than: datetime, items created before it are deleted
+        :param batch_size: int, number of items deleted per transaction
+        :return: int, number of deleted items, None if another process is pruning
+        """
+        with self._engine.connect() as lock_connection:
+            if not lock_connection.scalar(select(func.pg_try_advisory_lock(PRUNE_LOCK_KEY))):
+                return None
+            try:
+                return self._prune_items(older_than, batch_size)
+            finally:
+                lock_connection.execute(select(func.pg_advisory_unlock(PRUNE_LOCK_KEY)))
+                lock_connection.commit()
+
+    def _prune_items(self, older_than: datetime.datetime, batch_size: int) -> int:
+        deleted = 0
+        while True:
+            batch = (
+                select(VintedItem.id)
+                .where(VintedItem.created_at < older_than)
+                .order_by(VintedItem.id)
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            try:
+                unique_ids = list(self._session.scalars(
+                    delete(VintedItem).where(VintedItem.id.in_(batch)).returning(VintedItem.unique_id)
+                ))
+                self._session.commit()
+            except Exception:
+                self._session.rollback()
+                raise
+            seen_ids.discard(unique_ids)
+            deleted += len(unique_ids)
+            if len(unique_ids) < batch_size:
+                return deleted
 
     @property
     def unique_ids(self) -> set[int]:
         unique_ids = self._session.query(VintedItem.unique_id).all()
         return {unique_id[0] for unique_id in unique_ids}
 
+    @property
+    def seen_ids(self) -> SeenIdCache:
+        """
+        returns the cache of stored unique ids, loading it from the database on first use
+        :return: SeenIdCache
+        """
+        if not seen_ids.loaded:
+            seen_ids.load(self.unique_ids)
+        return seen_ids
+
     def get_category_name(self, category_id: int) -> str:
         """
         returns the category name for the given category id.
@@ -63,6 +230,110 @@ class VintedDbClient(ParserDbClientABC):
     def categories(self) -> set[Category]:
         """
         returns all categories
+        Categories are detached from the session, so commits made while parsing don't expire them.
         :return: set[Category], set of all categories
         """
-        return set(self._session.query(Category).all())
+        categories = self._session.query(Category).all()
+        for category in categories:
+            self._session.expunge(category)
+        return set(categories)
+
+    def get_categories(self, category_ids: list[int]) -> set[Category]:
+        """
+        returns the categories with the given ids, detached from the session
+        :param category_ids: list[int], category ids
+        :return: set[Category]
+        """
+        if not category_ids:
+            return set()
+        categories = self._session.query(Category).filter(Category.id.in_(category_ids)).all()
+        for category in categories:
+            self._session.expunge(category)
+        return set(categories)
+
+    def claim_categories(self, worker_id: str, limit: int, lease_seconds: float) -> list[int]:
+        """
+        Leases up to `limit` categories that are not leased or whose lease expired.
+        Categories being claimed by another worker at the same time are skipped, not waited for.
+        :param worker_id: str, id of the claiming worker
+        :param limit: int, maximum number of categories to claim
+        :param lease_seconds: float, lease duration
+        :return: list[int], ids of the claimed categories
+        """
+        try:
+            candidates = list(self._session.scalars(
+                select(Category.id)
+                .outerjoin(CategoryLease, CategoryLease.category_id == Category.id)
+                .where(or_(CategoryLease.category_id.is_(None), CategoryLease.expires_at < func.now()))
+                .order_by(Category.id)
+                .limit(limit)
+                .with_for_update(of=Category, skip_locked=True)
+            ))
+            if not candidates:
+                self._session.commit()
+                return []
+            expires_at = func.now() + datetime.timedelta(seconds=lease_seconds)
+            stmt = pg_insert(CategoryLease).values([
+                {'category_id': category_id, 'worker_id': worker_id, 'expires_at': expires_at}
+                for category_id in candidates
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CategoryLease.category_id],
+                set_={'worker_id': stmt.excluded.worker_id, 'expires_at': stmt.excluded.expires_at},
+                where=CategoryLease.expires_at < func.now(),
+            ).returning(CategoryLease.category_id)
+            claimed = list(self._session.scalars(stmt))
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+        return claimed
+
+    def heartbeat(self, worker_id: str, lease_seconds: float) -> list[int]:
+        """
+        Marks the worker alive and extends all leases it holds, both for lease_seconds.
+        Workers whose heartbeat expired are deleted.
+        Runs on its own connection, not the session, so a worker thread can call it while the session is busy.
+        :return: list[int], ids of the categories the worker still holds
+        """
+        expires_at = func.now() + datetime.timedelta(seconds=lease_seconds)
+        stmt = pg_insert(ParserWorker).values(worker_id=worker_id, expires_at=expires_at)
+        with self._engine.begin() as connection:
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[ParserWorker.worker_id], set_={'expires_at': stmt.excluded.expires_at},
+            ))
+            connection.execute(delete(ParserWorker).where(ParserWorker.expires_at < func.now()))
+            return list(connection.scalars(
+                update(CategoryLease)
+                .where(CategoryLease.worker_id == worker_id)
+                .values(expires_at=expires_at)
+                .returning(CategoryLease.category_id)
+            ))
+
+    def release_leases(self, worker_id: str, category_ids: list[int] = None):
+        """
+        Releases the given leases of the worker,
+        or all of them and the worker itself, so the other workers take over its share right away
+        """
+        stmt = delete(CategoryLease).where(CategoryLease.worker_id == worker_id)
+        if category_ids is not None:
+            stmt = stmt.where(CategoryLease.category_id.in_(category_ids))
+        try:
+            self._session.execute(stmt)
+            if category_ids is None:
+                self._session.execute(delete(ParserWorker).where(ParserWorker.worker_id == worker_id))
+            self._session.commit()
+        except Exception:
+            self._session.rollback()
+            raise
+
+    def lease_counts(self) -> tuple[int, int]:
+        """
+        :return: number of categories and number of live workers, including the ones that hold no leases yet
+        """
+        categories = self._session.scalar(select(func.count(Category.id)))
+        workers = self._session.scalar(
+            select(func.count(ParserWorker.worker_id)).where(ParserWorker.expires_at >= func.now())
+        )
+        self._session.commit()
+        return categories, workers
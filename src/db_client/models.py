@@ -3,7 +3,7 @@ SQLAlchemy models for the database
 """
 
 from sqlalchemy import Column, Integer, BigInteger, String, Numeric, Text, ForeignKey, Boolean, LargeBinary, \
-    UniqueConstraint
+    UniqueConstraint, DateTime, Index, false, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -23,9 +23,11 @@ class VintedItem(Base):
     url = Column(Text, nullable=False)
     image_url = Column(Text, nullable=False)
 
+    # category the item was stored for, the lowest id of its group, VintedItemCategory links it to all of them
     category_id = Column(Integer, ForeignKey('saved_categories.id'))
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
     category = relationship("Category")
-    users_published = relationship("UserPublishedItem", back_populates="item")
+    users_published = relationship("UserPublishedItem", back_populates="item", passive_deletes=True)
 
     def as_dict(self):
         return {
@@ -43,19 +45,39 @@ class VintedItem(Base):
         return f"VintedItem(id={self.id}, title='{self.title}', unique_id={self.unique_id}, price={self.price}, brand_name='{self.brand_name}', size='{self.size}')"
 
 
+class VintedItemCategory(Base):
+    """
+    Category an item was fetched for, an item fetched for several equivalent categories is linked to each of them
+    """
+    __tablename__ = 'vinted_item_categories'
+
+    category_id = Column(Integer, ForeignKey('saved_categories.id', ondelete='CASCADE'), primary_key=True)
+    item_id = Column(Integer, ForeignKey('vinted_items.id', ondelete='CASCADE'), primary_key=True, index=True)
+    # the link waits for push delivery by the bot, only set when the parser runs in separate worker processes
+    pending = Column(Boolean, nullable=False, server_default=false())
+
+    __table_args__ = (
+        Index('ix_vinted_item_categories_pending', 'item_id', postgresql_where=pending),
+    )
+
+    def __repr__(self):
+        return f"VintedItemCategory(category_id={self.category_id}, item_id={self.item_id}, pending={self.pending})"
+
+
 class Category(Base):
     __tablename__ = 'saved_categories'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(255), unique=True, nullable=False)
     brand_id = Column(Integer, ForeignKey('brands.id'), nullable=True, default=None)
+    newest_item_id = Column(BigInteger, nullable=True, default=None)  # high-water mark of ingested items
 
     relationship("TelegramBotUser", secondary="user_categories")
     relationship("Brand", uselist=False)
     relationship("VintedItem", back_populates="category")
 
     def __repr__(self):
-        return f"Category(id={self.id}, name='{self.name}', brand_id={self.brand_id})"
+        return f"Category(id={self.id}, name='{self.name}', brand_id={self.brand_id}, newest_item_id={self.newest_item_id})"
 
 
 class Brand(Base):
@@ -108,6 +130,10 @@ class UserCategory(Base):
 
     user_id = Column(Integer, ForeignKey("telegram_bot_users.id", ondelete="CASCADE"), primary_key=True)
     category_id = Column(Integer, ForeignKey("saved_categories.id", ondelete="CASCADE"), primary_key=True)
+    # every item of the category up to this id was delivered to the user, used when DELIVERY_TRACKING_MODE is 'cursor'
+    last_delivered_item_id = Column(Integer, default=0, server_default='0', nullable=False)
+
+    __table_args__ = (Index('ix_user_categories_category_id', 'category_id'),)
 
 
 class UserPublishedItem(Base):
@@ -118,7 +144,7 @@ class UserPublishedItem(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('telegram_bot_users.id'))
-    item_id = Column(BigInteger, ForeignKey('vinted_items.unique_id'))
+    item_id = Column(BigInteger, ForeignKey('vinted_items.unique_id', ondelete='CASCADE'))
 
     user = relationship("TelegramBotUser", back_populates="published_items")
     item = relationship("VintedItem", back_populates="users_published")
@@ -128,5 +154,28 @@ class UserPublishedItem(Base):
     __repr__ = __str__ = lambda self: f"UserPublishedItem(id={self.id}, user_id={self.user_id}, item_id={self.item_id})"
 
 
+class CategoryLease(Base):
+    """
+    Category claimed by a parser worker until the lease expires
+    """
+    __tablename__ = 'category_leases'
+
+    category_id = Column(Integer, ForeignKey('saved_categories.id', ondelete='CASCADE'), primary_key=True)
+    worker_id = Column(String(255), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
 
+    def __repr__(self):
+        return f"CategoryLease(category_id={self.category_id}, worker_id='{self.worker_id}', expires_at={self.expires_at})"
 
+
+class ParserWorker(Base):
+    """
+    Running parser worker, alive until its heartbeat expires
+    """
+    __tablename__ = 'parser_workers'
+
+    worker_id = Column(String(255), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return f"ParserWorker(worker_id='{self.worker_id}', expires_at={self.expires_at})"
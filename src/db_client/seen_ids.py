@@ -0,0 +1,53 @@
+"""
+This module contains the process-wide cache of stored item ids
+"""
+import threading
+from typing import Iterable
+
+
+class SeenIdCache:
+    """
+    Set of unique ids of items that are already stored in the database.
+    It is loaded from the database once and then kept up to date with every inserted batch,
+    so fetched items can be filtered without querying the database.
+    """
+
+    def __init__(self):
+        self._ids = set()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, unique_ids: Iterable[int]):
+        """
+        Replaces the cache content with ids read from the database
+        :param unique_ids: all stored unique ids
+        """
+        ids = set(unique_ids)
+        with self._lock:
+            self._ids = ids
+            self._loaded = True
+
+    def add(self, unique_ids: Iterable[int]):
+        with self._lock:
+            self._ids.update(unique_ids)
+
+    def discard(self, unique_ids: Iterable[int]):
+        with self._lock:
+            self._ids.difference_update(unique_ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids = set()
+
+    def __contains__(self, unique_id: int) -> bool:
+        return unique_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+seen_ids = SeenIdCache()
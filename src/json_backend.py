@@ -0,0 +1,14 @@
+"""
+This module contains the json decoder used for api responses.
+orjson is used when it is installed, the standard library decoder otherwise.
+"""
+try:
+    import orjson
+
+    loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    import json
+
+    loads = json.loads
+    JSON_BACKEND = 'json'
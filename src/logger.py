@@ -1,40 +1,121 @@
 """
 This module contains the logger class.
+Records are put on a queue by the callers and written to the log files by one background thread,
+so logging never blocks the event loop or the parser.
 """
 
+import atexit
 import logging
+import logging.handlers
 import os
-import sys
-import traceback
+import queue
+import threading
+import time
 from src.settings import DEBUG, LOG_FORMAT
 from src.settings import LOG_DEBUG_FILE_PATH, LOG_INFO_FILE_PATH, LOG_WARNING_FILE_PATH, \
-    LOG_ERROR_FILE_PATH
+    LOG_ERROR_FILE_PATH, LOG_MAX_BYTES, LOG_ROTATE_WHEN, LOG_BACKUP_COUNT, LOG_RATE_LIMIT, \
+    LOG_RATE_LIMIT_INTERVAL, LOG_PROCESS_NAME
 
 logging.basicConfig(format=LOG_FORMAT)
 
+_log_queue = queue.SimpleQueue()
+
+
+class LoggerNameFilter(logging.Filter):
+    """
+    Passes only records of one logger, so every log file gets the records of its own logger
+    """
+
+    def __init__(self, logger_name):
+        super().__init__()
+        self.logger_name = logger_name
+
+    def filter(self, record):
+        return record.name == self.logger_name
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `limit` records per call site every `interval` seconds.
+    The first record after a dropped burst tells how many records were dropped.
+    """
+
+    def __init__(self, limit, interval):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows = {}  # call site -> [window start, records in window, dropped records]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = f'{record.msg} ({dropped} similar messages dropped)'
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def _process_log_file_path(log_file_path):
+    """
+    Adds LOG_PROCESS_NAME to the file name, e.g. log_info.log -> log_info.worker-1.log,
+    so processes that run at the same time never write to or truncate the same file
+    """
+    if not LOG_PROCESS_NAME:
+        return log_file_path
+    root, extension = os.path.splitext(log_file_path)
+    return f'{root}.{LOG_PROCESS_NAME}{extension}'
+
+
+def _file_handler(log_file_path):
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            log_file_path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
 
 class CustomLogger:
     """
     Custom logger class that can be extended by other logger classes.
     """
 
-    def __init__(self, logger_name, log_level, log_file_path):
+    def __init__(self, logger_name, log_level, log_file_path, rate_limited=False):
         self.__logger = logging.getLogger(logger_name)
         self.__logger.setLevel(log_level)
-        handler = logging.FileHandler(log_file_path)
-        handler.setLevel(log_level)
-        handler.setFormatter(logging.Formatter(LOG_FORMAT))
-        handler.encoding = 'utf-8'
-        self.__logger.addHandler(handler)
-
+        self.__logger.propagate = False
+        queue_handler = logging.handlers.QueueHandler(_log_queue)
+        if rate_limited:
+            queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_LIMIT_INTERVAL))
+        self.__logger.addHandler(queue_handler)
+
+        log_file_path = _process_log_file_path(log_file_path)
+        os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
         if DEBUG:
             with open(log_file_path, 'w', encoding='utf-8'):
                 pass
 
+        self.handler = _file_handler(log_file_path)
+        self.handler.setLevel(log_level)
+        self.handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.handler.addFilter(LoggerNameFilter(logger_name))
+
     def __call__(self, *args, **kwargs):
         exc_info = kwargs.pop('exc_info', False)
         if exc_info and self.__logger.level == logging.ERROR:
             kwargs['exc_info'] = True
+        kwargs.setdefault('stacklevel', 2)  # report the caller, not this method
         self.__logger.log(self.__logger.level, *args, **kwargs)
 
 
@@ -44,7 +125,7 @@ class LoggerDebug(CustomLogger):
     """
 
     def __init__(self):
-        super().__init__('debug_logger', logging.DEBUG, LOG_DEBUG_FILE_PATH)
+        super().__init__('debug_logger', logging.DEBUG, LOG_DEBUG_FILE_PATH, rate_limited=True)
 
 
 class LoggerInfo(CustomLogger):
@@ -85,5 +166,23 @@ class Logger:
         self.warning = LoggerWarning()
         self.error = LoggerError()
 
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self._listener = logging.handlers.QueueListener(
+            _log_queue,
+            self.debug.handler, self.info.handler, self.warning.handler, self.error.handler, console_handler,
+            respect_handler_level=True,
+        )
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """
+        Writes the queued records and stops the writer thread
+        """
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
 
 logger = Logger()
@@ -2,16 +2,30 @@ import threading
 from tg_bot.bot import dp, on_startup, on_shutdown
 from tg_bot.command_handlers import *
 from tg_bot.callback_handlers import *
-from parser_scheduler import main as parser_main
+from tg_bot.delivery import delivery
+from tg_bot.sender import sender
+from src.metrics import start_metrics_server
+from settings import METRICS_ENABLED, PARSER_IN_PROCESS
 
 
 def start_parser_thread():
+    from parsers.parser_vinted import vinted
+    from parser_scheduler import main as parser_main
+
+    vinted.add_listener(delivery.submit)
     parser_thread = threading.Thread(target=parser_main, daemon=True)
     parser_thread.start()
 
 
 if __name__ == "__main__":
-    start_parser_thread()
+    if METRICS_ENABLED:
+        start_metrics_server()
+    if PARSER_IN_PROCESS:
+        start_parser_thread()
 
     from aiogram import executor
-    executor.start_polling(dp, on_startup=on_startup, on_shutdown=on_shutdown)
+    executor.start_polling(
+        dp,
+        on_startup=[on_startup, delivery.on_startup],
+        on_shutdown=[delivery.on_shutdown, sender.on_shutdown, on_shutdown],
+    )
@@ -0,0 +1,265 @@
+"""
+This module contains the metrics registry and the http endpoint that exposes it in the prometheus text format
+"""
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from src.logger import logger
+from src.settings import METRICS_HOST, METRICS_PORT
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric:
+    """
+    Base class of metrics, every combination of label values is a separate series
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value}' for key, value in values]
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """
+        Reads the value from function every time the metrics are rendered
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.error(f'Failed to read gauge {self.name}: {e}')
+        return [f'{self.name}{_format_labels(self.label_names, key)} {value}' for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def time(self, **labels):
+        """
+        Decorator that observes the duration of every call of a function or coroutine function
+        """
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        self.observe(time.perf_counter() - start, **labels)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        samples = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                labels = _format_labels(self.label_names, key, f'le="{le}"')
+                samples.append(f'{self.name}_bucket{labels} {cumulative}')
+            samples.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            samples.append(f'{self.name}_count{_format_labels(self.label_names, key)} {cumulative}')
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, labels))
+
+
+def histogram(name: str, documentation: str, labels: Iterable[str] = (),
+              buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labels, buckets))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT, ports: int = 1):
+    """
+    Serves /metrics from a daemon thread, does nothing if the server is already running or the port is 0
+    :param ports: number of consecutive ports tried from `port` on, the first free one is used
+    """
+    global _server
+    if _server is not None:
+        return
+    if not port:
+        logger.info('Metrics server is disabled')
+        return
+    for candidate in range(port, port + ports):
+        try:
+            _server = ThreadingHTTPServer((host, candidate), _MetricsHandler)
+        except OSError as e:
+            error = e
+            continue
+        threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f'Metrics are served on http://{host}:{candidate}/metrics')
+        return
+    logger.error(f'Failed to start metrics server on {host}:{port}-{port + ports - 1}: {error}')
+
+
+# parser
+vinted_fetch_seconds = histogram(
+    'vinted_fetch_seconds', 'Time to fetch all new items of a category query from vinted')
+vinted_http_responses_total = counter(
+    'vinted_http_responses_total', 'Responses received from vinted by status code', ['status'])
+vinted_http_retries_total = counter('vinted_http_retries_total', 'Retried requests to vinted')
+parser_cycle_seconds = histogram(
+    'parser_cycle_seconds', 'Duration of one parser cycle', buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+parser_update_interval_seconds = gauge(
+    'parser_update_interval_seconds', 'Initial poll interval of a category, cycles should stay well below it')
+
+# database
+db_items_offered_total = counter('db_items_offered_total', 'Items passed to VintedDbClient.insert_items')
+db_items_inserted_total = counter('db_items_inserted_total', 'Items actually inserted by VintedDbClient.insert_items')
+db_query_seconds = histogram('db_query_seconds', 'Duration of telegram bot database calls', ['function'])
+
+# telegram
+tg_send_seconds = histogram(
+    'tg_send_seconds', 'Time from queueing a bot api call to its result, rate limiting included', ['method'])
+tg_send_queue_size = gauge('tg_send_queue_size', 'Bot api calls waiting to be sent')
+tg_send_retries_total = counter('tg_send_retries_total', 'Bot api calls retried after flood control')
+tg_send_errors_total = counter('tg_send_errors_total', 'Bot api calls that failed', ['method'])
@@ -1,37 +1,165 @@
-import datetime
-import threading
 import time
-import schedule
-from settings import PARSER_UPDATE_INTERVAL, DEBUG
-from logger import logger
-from db_client.models import UserPublishedItem, VintedItem
-from tg_bot.db_handler import clear_table
-from parsers.parser_vinted import vinted
+from dataclasses import dataclass
+from settings import PARSER_UPDATE_INTERVAL, PARSER_MIN_POLL_INTERVAL, PARSER_MAX_POLL_INTERVAL, \
+    PARSER_TARGET_ITEMS_PER_POLL, PARSER_BACKOFF_FACTOR, PARSER_REQUEST_BUDGET, PARSER_CATEGORIES_REFRESH_INTERVAL, \
+    VINTED_ITEMS_PRUNE_INTERVAL, METRICS_ENABLED
+from src.logger import logger
+from src.metrics import parser_update_interval_seconds, start_metrics_server
+from rate_limit import TokenBucket
+from parsers.utils import category_query
 
+RATE_SMOOTHING = 0.3  # weight of the latest poll in the arrival rate estimate
 
-def start_parser():
-    try:
-        threading.Thread(target=vinted()).start()
-        logger.info(f'Successfully started parser thread for vinted')
-    except Exception as e:
-        logger.error(f'Failed to start parser thread for vinted: {e}', exc_info=True)
 
+@dataclass
+class CategoryPollState:
+    """
+    Polling state of one category
+    """
+    interval: float
+    next_poll_at: float
+    last_poll_at: float = None
+    arrival_rate: float = 0.0  # new items per second
 
-def scheduler():
-    if datetime.datetime.now().hour == 0:
-        clear_table()
-        time.sleep(360 * 5)  # Pause for 5 hours
 
-    schedule.every(PARSER_UPDATE_INTERVAL).minutes.do(start_parser)
-    time.sleep(10)
+class AdaptivePollScheduler:
+    """
+    Polls every category at its own interval.
+    Categories that get new items often are polled down to PARSER_MIN_POLL_INTERVAL,
+    categories without new items back off to PARSER_MAX_POLL_INTERVAL.
+    The number of requests sent to vinted never exceeds PARSER_REQUEST_BUDGET per minute,
+    processes that poll at the same time split it evenly.
+    """
+
+    def __init__(self, parser, category_source=None, workers_count=None):
+        """
+        :param parser: parser that polls the categories
+        :param category_source: callable that returns the categories to poll, all saved categories by default
+        :param workers_count: callable that returns the number of processes sharing the request budget,
+            read on every category refresh, 1 by default
+        """
+        self._parser = parser
+        self._category_source = category_source or (lambda: parser.categories)
+        self._workers_count = workers_count or (lambda: 1)
+        self._states: dict[int, CategoryPollState] = {}
+        self._categories = {}
+        self._queries = {}
+        self._categories_refreshed_at = None
+        self._pruned_at = None
+        self._budget = TokenBucket(rate=PARSER_REQUEST_BUDGET / 60, capacity=PARSER_REQUEST_BUDGET)
+        parser_update_interval_seconds.set(PARSER_UPDATE_INTERVAL * 60)
+
+    def _refresh_categories(self, now: float):
+        categories = {category.id: category for category in self._category_source()}
+        for category_id in categories.keys() - self._states.keys():
+            self._states[category_id] = CategoryPollState(interval=PARSER_UPDATE_INTERVAL * 60, next_poll_at=now)
+        for category_id in self._states.keys() - categories.keys():
+            del self._states[category_id]
+        self._categories = categories
+        self._queries = {}
+        for category in categories.values():
+            self._queries.setdefault(category_query(category), []).append(category)
+        self._categories_refreshed_at = now
+        budget = PARSER_REQUEST_BUDGET / max(self._workers_count(), 1)
+        if budget != self._budget.capacity:
+            self._budget.set_rate(rate=budget / 60, capacity=budget)
+            logger.info(f'Request budget set to {budget:.0f} requests per minute')
+
+    def _due_categories(self, now: float) -> tuple[list, int]:
+        """
+        :return: categories to poll and the number of requests paid for them
+        """
+        due = sorted(
+            (state.next_poll_at, category_id)
+            for category_id, state in self._states.items()
+            if state.next_poll_at <= now
+        )
+        admitted = {}
+        paid = 0
+        for _, category_id in due:
+            if category_id in admitted:
+                continue
+            if not self._budget.try_acquire():
+                break
+            paid += 1
+            query = category_query(self._categories[category_id])
+            # equivalent categories are fetched with the same request, so they are polled together for free
+            for category in self._queries[query]:
+                admitted[category.id] = category
+        return list(admitted.values()), paid
+
+    def _update_state(self, state: CategoryPollState, new_items: int, now: float):
+        if state.last_poll_at is not None:
+            observed_rate = new_items / max(now - state.last_poll_at, 1)
+            state.arrival_rate = RATE_SMOOTHING * observed_rate + (1 - RATE_SMOOTHING) * state.arrival_rate
+
+        if new_items == 0:
+            interval = state.interval * PARSER_BACKOFF_FACTOR
+        elif state.arrival_rate > 0:
+            interval = PARSER_TARGET_ITEMS_PER_POLL / state.arrival_rate
+        else:
+            interval = state.interval
+        state.interval = min(max(interval, PARSER_MIN_POLL_INTERVAL), PARSER_MAX_POLL_INTERVAL)
+        state.last_poll_at = now
+        state.next_poll_at = now + state.interval
+
+    def _prune_items(self, now: float):
+        self._pruned_at = now
+        try:
+            deleted = self._parser.prune_items()
+        except Exception as e:
+            logger.error(f'Failed to prune old items: {e}', exc_info=True)
+            return
+        if deleted is None:
+            logger.info('Skipped pruning, another process is pruning old items')
+            return
+        logger.info(f'Pruned {deleted} old items')
+
+    def run_pending(self):
+        """
+        Polls all categories that are due while the request budget allows it
+        """
+        now = time.monotonic()
+        if self._pruned_at is None or now - self._pruned_at >= VINTED_ITEMS_PRUNE_INTERVAL:
+            self._prune_items(now)
+
+        if self._categories_refreshed_at is None \
+                or now - self._categories_refreshed_at >= PARSER_CATEGORIES_REFRESH_INTERVAL:
+            self._refresh_categories(now)
+
+        categories, paid = self._due_categories(now)
+        if not categories:
+            return
+
+        try:
+            results = self._parser(set(categories))
+        except Exception as e:
+            logger.error(f'Failed to run parser for vinted: {e}', exc_info=True)
+            return
+
+        # one request of every admitted query was paid for up front, extra pages are charged now
+        self._budget.consume(sum(result.requests for result in results.values()) - paid)
+        now = time.monotonic()
+        for category_id, result in results.items():
+            state = self._states[category_id]
+            if result.skipped:
+                # skipped while vinted is unavailable, try again soon without backing off
+                state.next_poll_at = now + PARSER_MIN_POLL_INTERVAL
+                continue
+            self._update_state(state, result.new_items, now)
+        logger.info(f'Polled {len(results)} categories, {sum(r.new_items for r in results.values())} new items')
 
 
 def main():
-    scheduler()
+    from parsers.parser_vinted import vinted  # connects to the database on import
+
+    poll_scheduler = AdaptivePollScheduler(vinted)
     while True:
-        schedule.run_pending()
-        time.sleep(5)
+        poll_scheduler.run_pending()
+        time.sleep(1)
 
 
 if __name__ == '__main__':
+    if METRICS_ENABLED:
+        start_metrics_server()
     main()
@@ -0,0 +1,103 @@
+"""
+Standalone parser worker. Any number of workers can run at once, on one host or several.
+Every worker sends a heartbeat to the parser_workers table from its own thread, leases its share of the categories
+in the category_leases table and renews the leases with every heartbeat, so a long parse cycle doesn't let them
+expire. Categories of a worker that stopped sending heartbeats are claimed by the others once its leases expire.
+
+Every worker logs to its own files, named after LOG_PROCESS_NAME (worker-<pid> by default),
+and serves /metrics on the first free port after METRICS_PORT.
+
+Usage: python parser_worker.py
+"""
+import math
+import os
+import signal
+import socket
+import threading
+import time
+
+os.environ.setdefault('LOG_PROCESS_NAME', f'worker-{os.getpid()}')  # read by the logger on import
+
+from settings import PARSER_HEARTBEAT_INTERVAL, PARSER_LEASE_TTL, METRICS_ENABLED, METRICS_PORT, METRICS_WORKER_PORTS
+from src.logger import logger
+from src.metrics import start_metrics_server
+from parser_scheduler import AdaptivePollScheduler
+
+
+class LeasedCategories:
+    """
+    Category source of a worker: renews the leases the worker holds, gives back categories above its fair share
+    and claims free ones up to it. The fair share is the number of categories divided by the number of workers
+    with a live heartbeat, so workers that hold nothing yet make the others give categories back.
+    """
+
+    def __init__(self, parser, worker_id: str):
+        self._parser = parser
+        self._db_client = parser.db_client
+        self.worker_id = worker_id
+        self.workers_count = 1  # live workers seen on the last refresh
+        self._stopped = threading.Event()
+        self._heartbeat_thread = threading.Thread(target=self._send_heartbeats, daemon=True)
+
+    def start(self):
+        """
+        Starts sending heartbeats every PARSER_HEARTBEAT_INTERVAL seconds, independently of the parse cycles
+        """
+        self._heartbeat_thread.start()
+
+    def _send_heartbeats(self):
+        while not self._stopped.wait(PARSER_HEARTBEAT_INTERVAL):
+            try:
+                self._db_client.heartbeat(self.worker_id, PARSER_LEASE_TTL)
+            except Exception as e:
+                logger.error(f'Worker {self.worker_id} failed to send a heartbeat: {e}', exc_info=True)
+
+    def __call__(self) -> set:
+        held = sorted(self._db_client.heartbeat(self.worker_id, PARSER_LEASE_TTL))
+        categories_count, workers_count = self._parser.run_db_sync(self._db_client.lease_counts)
+        self.workers_count = max(workers_count, 1)
+        share = math.ceil(categories_count / self.workers_count)
+
+        if len(held) > share:
+            self._parser.run_db_sync(self._db_client.release_leases, self.worker_id, held[share:])
+            held = held[:share]
+        elif len(held) < share:
+            held += self._parser.run_db_sync(
+                self._db_client.claim_categories, self.worker_id, share - len(held), PARSER_LEASE_TTL
+            )
+        logger.info(f'Worker {self.worker_id} holds {len(held)} of {categories_count} categories')
+        return self._parser.run_db_sync(self._db_client.get_categories, held)
+
+    def release(self):
+        self._stopped.set()
+        if self._heartbeat_thread.is_alive():
+            self._heartbeat_thread.join()
+        self._parser.run_db_sync(self._db_client.release_leases, self.worker_id)
+        logger.info(f'Worker {self.worker_id} released its categories')
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    from parsers.parser_vinted import vinted  # connects to the database on import
+
+    signal.signal(signal.SIGTERM, _stop)
+    leases = LeasedCategories(vinted, f'{socket.gethostname()}-{os.getpid()}')
+    poll_scheduler = AdaptivePollScheduler(vinted, leases, lambda: leases.workers_count)
+    leases.start()
+    try:
+        while True:
+            poll_scheduler.run_pending()
+            time.sleep(1)
+    finally:
+        leases.release()
+        vinted.close()
+
+
+if __name__ == '__main__':
+    if METRICS_ENABLED and METRICS_PORT:
+        # METRICS_PORT is left to the bot, workers on one host take the next free ports
+        start_metrics_server(port=METRICS_PORT + 1, ports=METRICS_WORKER_PORTS)
+    main()
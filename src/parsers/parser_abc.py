@@ -3,7 +3,7 @@ This module contains parsers for vinted.pl and grailed.com
 """
 
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, List
 
 from src.data_structures import Item
 from src.logger import logger
@@ -18,6 +18,23 @@ class Parser(ABC):
     def __init__(self):
         self._reference = None
         self._db_client = None
+        self._listeners = []
+
+    def add_listener(self, listener: Callable[[List[Item]], None]):
+        """
+        Registers a callable that receives every batch of newly inserted items.
+        Listeners are called from the thread that inserted the batch, the db executor thread of the parser,
+        never from an event loop thread, so they must hand the items over without blocking.
+        :param listener: callable that takes List[Item]
+        """
+        self._listeners.append(listener)
+
+    def _notify_listeners(self, items: List[Item]):
+        for listener in self._listeners:
+            try:
+                listener(items)
+            except Exception as e:
+                logger.error(f'Listener {listener} failed: {e}', exc_info=True)
 
     @abstractmethod
     def _get_new_items(self, category: str) -> List[Item]:
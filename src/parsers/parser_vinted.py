@@ -2,17 +2,28 @@
 This module contains parser for vinted.pl
 """
 
+import asyncio
+import contextvars
+import datetime
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import urllib3
 
-from src.data_structures import Item
+from src.data_structures import CategoryQuery, Item, PollResult
 from src.db_client.db_client_vinted import VintedDbClient
 from src.db_client.models import Category
 from src.logger import logger
-from src.requester import requester as http
-from src.settings import BASE_DIR
-from src.parsers.utils import vinted_category_url
+from src.metrics import parser_cycle_seconds, vinted_fetch_seconds
+from src.tracing import profiler, span
+from src.requester import requester as http, AsyncVintedRequester
+from src.request_policy import CircuitOpenError
+from src.settings import BASE_DIR, PARSER_CONCURRENCY_LIMIT, VINTED_ITEMS_PER_PAGE, VINTED_MAX_PAGES, \
+    VINTED_ITEMS_RETENTION_DAYS
+from src.parsers.utils import group_categories, vinted_query_url
 from src.parsers.parser_abc import Parser
 
 
@@ -26,32 +37,170 @@ class VintedParser(Parser):
         self._db_client = VintedDbClient()
         self._reference = 'vinted'
         self._requester = http
-        self._db_client.clear_table()
+        # The db session is not thread safe, so all db calls go through a single worker thread
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vinted-db')
+        self._seen_ids = None
+        # the loop and the async requester live as long as the parser, so connections are kept alive between cycles
+        self._loop = None
+        self._async_requester = None
 
     def __str__(self):
         return 'Vinted Parser'
 
-    def __call__(self, *args, **kwargs):
+    def __call__(self, categories: set[Category] = None) -> dict[int, PollResult]:
+        """
+        Parses the given categories, or all saved categories
+        :param categories: categories to parse
+        :return: dict[int, PollResult], poll result of every category by its id
+        """
         logger.debug('Starting Vinted Parser')
-        for category in self._db_client.categories:
-            logger.debug(f'Parsing {category}')
-            new_items = self._get_new_items(category)
+        if categories is None:
+            categories = self._db_client.categories
+        start = time.perf_counter()
+        with profiler.cycle(), span('parser.cycle', categories=len(categories)):
+            results = self._run(self._parse_categories(categories))
+        parser_cycle_seconds.observe(time.perf_counter() - start)
+        logger.debug('Done parsing')
+        return {result.category_id: result for result in results}
+
+    @property
+    def categories(self) -> set[Category]:
+        return self._db_client.categories
+
+    @property
+    def db_client(self) -> VintedDbClient:
+        return self._db_client
+
+    def run_db_sync(self, func, *args):
+        """
+        Runs a blocking database call on the db worker thread and waits for its result
+        """
+        return self._db_executor.submit(func, *args).result()
+
+    def close(self):
+        """
+        Closes the pooled connections and the event loop of the parser
+        """
+        if self._loop is None:
+            return
+        if self._async_requester is not None:
+            self._loop.run_until_complete(self._async_requester.close())
+            self._async_requester = None
+        self._loop.close()
+        self._loop = None
+
+    def _run(self, coroutine):
+        """
+        Runs the coroutine on the event loop of the parser, must always be called from the same thread
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    def prune_items(self) -> Optional[int]:
+        """
+        Deletes items older than VINTED_ITEMS_RETENTION_DAYS
+        :return: int, number of deleted items, None if another process is pruning
+        """
+        older_than = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=VINTED_ITEMS_RETENTION_DAYS)
+        return self.run_db_sync(self._db_client.prune_items, older_than)
+
+    async def _parse_categories(self, categories: set[Category]) -> list[PollResult]:
+        """
+        Fetches all categories concurrently, at most PARSER_CONCURRENCY_LIMIT at a time.
+        Equivalent categories are fetched with one request and the items are fanned out to each of them.
+        Every group is inserted as soon as its response arrives.
+        :param categories: categories to parse
+        """
+        self._seen_ids = await self._run_db(lambda: self._db_client.seen_ids)
+        semaphore = asyncio.Semaphore(PARSER_CONCURRENCY_LIMIT)
+        if self._async_requester is None:
+            self._async_requester = await AsyncVintedRequester(self._requester, PARSER_CONCURRENCY_LIMIT).open()
+        results = await asyncio.gather(
+            *(self._parse_query(self._async_requester, semaphore, query, group)
+              for query, group in group_categories(categories).items())
+        )
+        return [result for group_results in results for result in group_results]
+
+    async def _parse_query(self, requester: AsyncVintedRequester, semaphore: asyncio.Semaphore,
+                           query: CategoryQuery, categories: list[Category]) -> list[PollResult]:
+        """
+        Fetches one query and inserts its new items for every category that shares it.
+        The requests are accounted to the first category.
+        """
+        with span('parser.query', query=query.search_text, categories=len(categories)):
+            logger.debug(f'Parsing {query} for {categories}')
+            results = [PollResult(category_id=category.id) for category in categories]
+            marks = [category.newest_item_id for category in categories]
+            newest_item_id = None if None in marks else min(marks)
+            try:
+                async with semaphore:
+                    start = time.perf_counter()
+                    raw_items, results[0].requests = await self._get_new_items(query, newest_item_id, requester)
+                vinted_fetch_seconds.observe(time.perf_counter() - start)
+            except CircuitOpenError:
+                logger.debug(f'Skipped {query}, vinted is unavailable')
+                for result in results:
+                    result.skipped = True
+                return results
+            except Exception as e:
+                logger.error(f'Failed to fetch {query}: {e}', exc_info=True)
+                results[0].requests = 1
+                return results
+
+            new_items = []
+            for category, result in zip(categories, results):
+                category_items = [
+                    self._get_item(item, category) for item in raw_items
+                    if category.newest_item_id is None or item['id'] > category.newest_item_id
+                ]
+                result.new_items = len(category_items)
+                new_items.extend(category_items)
+
             if new_items:
-                self._insert_items(new_items)
+                # an item is stored once and linked to every category of the group
+                await self._run_db(self._insert_items, new_items)
             else:
                 logger.debug('No new items')
-        logger.debug(f'Done parsing f{category}')
-
-    def _get_new_items(self, category: Category) -> list[Item]:
-        #  I need to get all the categories and then get all the items from each
-        api_url = vinted_category_url(category)
-        search_response = http.get(api_url)
-        items = search_response['items']
-        unique_ids = self._db_client.unique_ids
-        logger.debug(f'Found {len(unique_ids)} unique ids in database')
-        result = [self._get_item(item, category) for item in items]
-        logger.debug(f'Fetched {len(items)} items from API for category_id {category}')
-        return result
+            return results
+
+    async def _run_db(self, func, *args):
+        """
+        Runs a blocking database call on the db worker thread, in the context of the current span
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._db_executor, context.run, self._db_call, func, *args)
+
+    @staticmethod
+    def _db_call(func, *args):
+        with span('db.call', function=getattr(func, '__name__', repr(func))):
+            return func(*args)
+
+    async def _get_new_items(self, query: CategoryQuery, newest_item_id: int,
+                             requester: AsyncVintedRequester) -> tuple[list[dict], int]:
+        """
+        Scans catalog pages from newest to oldest until a page reaches the high-water mark
+        or contains an already stored item, the catalog runs out or VINTED_MAX_PAGES is reached.
+        Without a high-water mark only the first page is scanned.
+        :return: new items as returned by the api and the number of fetched pages
+        """
+        result = []
+        fetched_ids = set()  # listings shift between pages while new items arrive
+        for page in range(1, VINTED_MAX_PAGES + 1):
+            search_response = await requester.get(vinted_query_url(query, page))
+            items = search_response['items']
+            if newest_item_id is not None:
+                items_past_mark = [item for item in items if item['id'] > newest_item_id]
+            else:
+                items_past_mark = items
+            new_items = [item for item in items_past_mark if item['id'] not in self._seen_ids]
+            result.extend(item for item in new_items if item['id'] not in fetched_ids)
+            fetched_ids.update(item['id'] for item in items)
+            logger.debug(f'Fetched {len(items)} items from API for {query}, page {page}')
+            if newest_item_id is None or len(new_items) < len(items) or len(items) < VINTED_ITEMS_PER_PAGE:
+                break
+        return result, page
 
     def _get_item(self, item: dict, category: Category) -> Item:
         return Item(
@@ -68,12 +217,16 @@ class VintedParser(Parser):
     def _insert_items(self, items: list[Item]):
         logger.debug(f'Inserting {len(items)} items to database')
         try:
-            self._db_client.insert_items(items)
-            logger.debug(f'Inserted {len(items)} items to the database')
+            linked = self._db_client.insert_items(items)
+            logger.debug(f'Inserted {len(linked)} of {len(items)} items to the database')
             logger.debug('Database updated')
         except Exception as e:
             logger.error(e)
             logger.error('Failed to insert items to database', exc_info=True)
+            return
+        new_items = [item for item in items if (item.unique_id, item.category_id) in linked]
+        if new_items:
+            self._notify_listeners(new_items)
 
 
 vinted = VintedParser()
@@ -81,3 +234,4 @@ vinted = VintedParser()
 
 if __name__ == '__main__':
     vinted()
+    vinted.close()
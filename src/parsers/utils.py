@@ -1,30 +1,56 @@
 """
 This module contains functions that are used in other modules
 """
-import sys
-import time
-from alive_progress import alive_bar
-from functools import wraps
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.by import By
+from typing import Iterable
 
+from src.data_structures import CategoryQuery
 from src.db_client.models import Category
-from src.settings import VINTED_ITEMS_PER_PAGE
+from src.settings import VINTED_ITEMS_PER_PAGE, VINTED_URL
 
 Url = str
 
 
-def vinted_category_url(requested_category: Category) -> Url:
+def normalize_search_text(search_text: str) -> str:
     """
-    Returns url for vinted category
-    :param requested_category: Category object from db
-    :type requested_category: Category
+    Lowercases search text and collapses whitespace, e.g. ' Nike  Air' -> 'nike air'
+    """
+    return ' '.join(search_text.lower().split())
+
+
+def category_query(category: Category) -> CategoryQuery:
+    """
+    Returns the normalized search of the category
+    :param category: Category object from db
+    :return: CategoryQuery
+    """
+    return CategoryQuery(search_text=normalize_search_text(category.name), brand_id=category.brand_id or None)
+
+
+def group_categories(categories: Iterable[Category]) -> dict[CategoryQuery, list[Category]]:
+    """
+    Groups equivalent categories, so every group can be fetched with one request
+    :param categories: Category objects from db
+    :return: dict[CategoryQuery, list[Category]], categories of every group sorted by id
+    """
+    groups = {}
+    for category in sorted(categories, key=lambda c: c.id):
+        groups.setdefault(category_query(category), []).append(category)
+    return groups
+
+
+def vinted_query_url(query: CategoryQuery, page: int = 1) -> Url:
+    """
+    Returns url for vinted catalog search, items are ordered from newest to oldest
+    :param query: normalized search
+    :type query: CategoryQuery
+    :param page: number of the catalog page
+    :type page: int
     :return: Url
     :rtype: Url
     """
-    title = requested_category.name.replace(' ', '+')
-    brand_id = requested_category.brand_id if requested_category.brand_id else ''
-    return f'https://www.vinted.pl/api/v2/catalog/items?search_text=' \
+    title = query.search_text.replace(' ', '+')
+    brand_id = query.brand_id if query.brand_id else ''
+    return f'{VINTED_URL}/api/v2/catalog/items?search_text=' \
            f'{title}' \
            f'&catalog_ids=' \
            f'&color_ids=' \
@@ -33,22 +59,20 @@ def vinted_category_url(requested_category: Category) -> Url:
            f'&material_ids=' \
            f'&video_game_rating_ids=' \
            f'&status_ids=' \
-           f'&page=1&' \
+           f'&order=newest_first' \
+           f'&page={page}&' \
            f'per_page={VINTED_ITEMS_PER_PAGE}'
 
 
-def timer_decorator(func):
+def vinted_category_url(requested_category: Category, page: int = 1) -> Url:
     """
-    Decorator that prints function execution time
-    :param func:
-    :return: str: time in seconds
+    Returns url for vinted category, items are ordered from newest to oldest
+    :param requested_category: Category object from db
+    :type requested_category: Category
+    :param page: number of the catalog page
+    :type page: int
+    :return: Url
+    :rtype: Url
     """
+    return vinted_query_url(category_query(requested_category), page)
 
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        print(f"Function {func.__name__} took {end_time - start_time} seconds to run.")
-        return result
-
-    return wrapper
@@ -0,0 +1,83 @@
+"""
+This module contains rate limiting primitives
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket.
+    Tokens are refilled continuously at `rate` per second up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        Takes tokens if enough of them are available
+        :param tokens: number of tokens to take
+        :return: bool, True if the tokens were taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes tokens unconditionally and returns how long the caller has to wait until they are refilled.
+        Callers that sleep for the returned time are served in the order of their reservations.
+        :param tokens: number of tokens to take
+        :return: float, seconds to wait
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def set_rate(self, rate: float, capacity: float):
+        """
+        Changes the refill rate and the capacity, tokens above the new capacity are dropped
+        """
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = capacity
+            self._tokens = min(self._tokens, capacity)
+
+    def hold(self, seconds: float):
+        """
+        Takes tokens so that the next one is available in `seconds` at the earliest
+        :param seconds: time to hold the bucket back
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 1 - seconds * self.rate)
+
+    def consume(self, tokens: float):
+        """
+        Takes tokens unconditionally, the bucket may go into debt
+        :param tokens: number of tokens to take
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
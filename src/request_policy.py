@@ -0,0 +1,166 @@
+"""
+This module contains the retry and circuit breaker policy for http requests
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the upstream is considered down
+    """
+
+
+class CircuitBreaker:
+    """
+    Thread safe circuit breaker.
+    After `failure_threshold` consecutive failures the circuit opens and requests fail fast.
+    After `reset_timeout` seconds a single trial request is let through,
+    its success closes the circuit and its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_request(self):
+        """
+        :raises CircuitOpenError: if the request must not be sent
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError('Circuit is open, upstream is unavailable')
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_skipped(self):
+        """
+        The request ended before the upstream answered or failed, only the trial slot is freed
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def _always(error: Exception) -> bool:
+    return True
+
+
+def _never(error: Exception) -> bool:
+    return False
+
+
+class RequestPolicy:
+    """
+    Capped exponential backoff with full jitter on top of a circuit breaker.
+    The same policy can be used by sync and async callers.
+    Only errors accepted by `is_failure` count towards opening the circuit, errors accepted by `is_response`
+    carry an answer of the upstream and reset the failure count like a success, other errors leave it as it is.
+    Only errors accepted by `is_retryable` are retried.
+    A CircuitOpenError raised by the request, e.g. by the policy of a token refresh it depends on,
+    is raised at once without touching the circuit.
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, timeout: float,
+                 circuit_breaker: CircuitBreaker, is_failure: Callable[[Exception], bool] = _always,
+                 is_retryable: Callable[[Exception], bool] = _always,
+                 is_response: Callable[[Exception], bool] = _never):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.circuit_breaker = circuit_breaker
+        self.is_failure = is_failure
+        self.is_retryable = is_retryable
+        self.is_response = is_response
+
+    def backoff(self, attempt: int) -> float:
+        """
+        :param attempt: number of the failed attempt, starting from 1
+        :return: float, seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _record_error(self, error: Exception) -> bool:
+        """
+        :return: bool, True if the call should be retried
+        """
+        if isinstance(error, CircuitOpenError):
+            self.circuit_breaker.record_skipped()
+            return False
+        if self.is_failure(error):
+            self.circuit_breaker.record_failure()
+        elif self.is_response(error):
+            self.circuit_breaker.record_success()
+        else:
+            self.circuit_breaker.record_skipped()
+        return self.is_retryable(error) and not self.circuit_breaker.is_open
+
+    def call(self, func: Callable, *args, on_retry: Callable[[Exception], None] = None, **kwargs):
+        """
+        Calls func until it succeeds or the attempts run out
+        :param func: callable that performs the request
+        :param on_retry: callable that gets the error before every retry
+        :return: result of func
+        :raises CircuitOpenError: if the circuit is open
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.circuit_breaker.before_request()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self._record_error(e) or attempt == self.max_attempts:
+                    raise
+                if on_retry is not None:
+                    on_retry(e)
+                time.sleep(self.backoff(attempt))
+            else:
+                self.circuit_breaker.record_success()
+                return result
+
+    async def call_async(self, func: Callable[..., Awaitable], *args,
+                         on_retry: Callable[[Exception], Awaitable] = None, **kwargs):
+        """
+        Awaits func until it succeeds or the attempts run out
+        :param func: coroutine function that performs the request
+        :param on_retry: coroutine function that gets the error before every retry
+        :return: result of func
+        :raises CircuitOpenError: if the circuit is open
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.circuit_breaker.before_request()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if not self._record_error(e) or attempt == self.max_attempts:
+                    raise
+                if on_retry is not None:
+                    await on_retry(e)
+                await asyncio.sleep(self.backoff(attempt))
+            else:
+                self.circuit_breaker.record_success()
+                return result
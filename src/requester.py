@@ -1,84 +1,256 @@
+import asyncio
 import time
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from src.json_backend import loads
 from src.logger import logger
+from src.metrics import vinted_http_responses_total, vinted_http_retries_total
+from src.tracing import span
+from src.request_policy import CircuitBreaker, RequestPolicy
+from src.settings import PARSER_CONCURRENCY_LIMIT, VINTED_REQUEST_TIMEOUT, VINTED_RETRY_ATTEMPTS, \
+    VINTED_RETRY_BASE_DELAY, VINTED_RETRY_MAX_DELAY, VINTED_CIRCUIT_FAILURE_THRESHOLD, \
+    VINTED_CIRCUIT_RESET_TIMEOUT, VINTED_KEEPALIVE_TIMEOUT, VINTED_COOKIES_REFRESH_MARGIN, \
+    VINTED_COOKIES_DEFAULT_TTL, VINTED_COOKIES_RETRY_INTERVAL, VINTED_URL
+from src.token_manager import Cookies, TokenManager
 
 HEADERS = {
     "User-Agent": "PostmanRuntime/7.28.4",
     "Host": "www.vinted.pl",
 }
 
-DOMAIN = "pl"
-
-VINTED_URL = f"https://www.vinted.{DOMAIN}"
-VINTED_AUTH_URL = f"https://www.vinted.{DOMAIN}/auth/token_refresh"
-VINTED_API_URL = f"https://www.vinted.{DOMAIN}/api/v2"
+VINTED_AUTH_URL = f"{VINTED_URL}/auth/token_refresh"
+VINTED_API_URL = f"{VINTED_URL}/api/v2"
 VINTED_PRODUCTS_ENDPOINT = "catalog/items"
 
 
+AUTH_ERROR_STATUSES = (401, 403)
+
+TOO_MANY_REQUESTS_STATUS = 429
+
+
+def _error_status(error: Exception) -> int:
+    """
+    returns the http status of a response error, None for other errors
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status
+    return None
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """
+    Timeouts, connection errors, 5xx and 429 mean vinted is failing or overloaded.
+    Other 4xx are caused by the request itself and say nothing about vinted.
+    """
+    status = _error_status(error)
+    if status is not None:
+        return status >= 500 or status == TOO_MANY_REQUESTS_STATUS
+    return isinstance(error, (requests.Timeout, requests.ConnectionError, asyncio.TimeoutError,
+                              aiohttp.ClientConnectionError, aiohttp.ClientPayloadError))
+
+
+def is_upstream_response(error: Exception) -> bool:
+    """
+    Errors that carry a response of vinted, it is up even if the request was refused
+    """
+    return _error_status(error) is not None
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Upstream failures are retried, and auth errors too, because the cookies are refreshed before the retry
+    """
+    return is_upstream_failure(error) or _error_status(error) in AUTH_ERROR_STATUSES
+
+
+def _create_policy() -> RequestPolicy:
+    return RequestPolicy(
+        max_attempts=VINTED_RETRY_ATTEMPTS,
+        base_delay=VINTED_RETRY_BASE_DELAY,
+        max_delay=VINTED_RETRY_MAX_DELAY,
+        timeout=VINTED_REQUEST_TIMEOUT,
+        circuit_breaker=CircuitBreaker(VINTED_CIRCUIT_FAILURE_THRESHOLD, VINTED_CIRCUIT_RESET_TIMEOUT),
+        is_failure=is_upstream_failure,
+        is_retryable=is_retryable,
+        is_response=is_upstream_response,
+    )
+
+
+# shared by the sync and async requesters, so both stop calling vinted while it is down
+request_policy = _create_policy()
+
+# cookie refreshes have their own circuit, so they never take the trial request of the catalog circuit
+auth_request_policy = _create_policy()
+
+
 class VintedRequester:
     """
     requester class used to perform http requests to vinted.pl
     """
 
-    def __init__(self):
+    def __init__(self, policy: RequestPolicy = request_policy, auth_policy: RequestPolicy = auth_request_policy):
         self.vinted_url = VINTED_URL
         self.vinted_auth_url = VINTED_AUTH_URL
         self.vinted_api_url = VINTED_API_URL
         self.vinted_products_endpoint = VINTED_PRODUCTS_ENDPOINT
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
-        self.set_cookies()
+        self.policy = policy
+        self.auth_policy = auth_policy
+        self.session = self._create_session()
+        self._auth_session = self._create_session()  # used by the token refresh thread only
+        self.token_manager = TokenManager(
+            self._fetch_cookies,
+            refresh_margin=VINTED_COOKIES_REFRESH_MARGIN,
+            retry_interval=VINTED_COOKIES_RETRY_INTERVAL,
+        )
+        try:
+            self.set_cookies()
+        except Exception as e:
+            logger.error(f"Failed to set cookies for {self.vinted_url}: {e}")
+        self.token_manager.start()
+
+    @staticmethod
+    def _create_session() -> requests.Session:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PARSER_CONCURRENCY_LIMIT, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
     def get(self, url, data=None):
         """
-        Perform a http get request.
+        Perform a http get request, retried according to the request policy.
         :param url: str
         :param data: dict, optional
         :return: dict
             Json format
+        :raises CircuitOpenError: if vinted is unavailable
         """
-        try:
-            response = self.session.get(url, params=data)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(e, exc_info=True)
-            self.set_cookies()
-            return self.get(url, data)
+        return self.policy.call(self._get, url, data, on_retry=self._on_retry)
+
+    def _get(self, url, data=None):
+        generation = self.token_manager.generation
+        with span('http.get', url=url):
+            response = self.session.get(url, params=data, cookies=self.token_manager.cookies,
+                                        timeout=self.policy.timeout)
+        vinted_http_responses_total.inc(status=response.status_code)
+        if response.status_code in AUTH_ERROR_STATUSES:
+            self.token_manager.refresh(generation)
+        response.raise_for_status()
+        return loads(response.content)
 
     def post(self, url, params=None):
         """
-        Perform a http post request.
+        Perform a http post request, retried according to the request policy.
         :param url: url to post to
         :param params: params to post
-        :return: none
+        :return: response
         """
-        response = self.session.post(url, params)
-        try:
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(e, exc_info=True)
-            self.set_cookies()
+        return self.policy.call(self._post, url, params, on_retry=self._on_retry)
 
+    def _post(self, url, params=None, session: requests.Session = None):
+        response = (session or self.session).post(url, params, timeout=self.policy.timeout)
+        vinted_http_responses_total.inc(status=response.status_code)
+        response.raise_for_status()
         return response
 
-    def set_cookies(self, attempt=1):
-        """used to set cookies"""
-        if attempt > 3:
-            logger.error("Failed to set cookies after 3 attempts")
-            time.sleep(60)
-            self.set_cookies()
+    def _on_retry(self, error: Exception):
+        vinted_http_retries_total.inc()
+        logger.warning(f"Request to {self.vinted_url} failed, retrying: {error}")
 
-        try:
-            self.post(self.vinted_auth_url)
-            logger.info("Cookies set!")
-        except Exception as e:
-            logger.error(
-                f"There was an error fetching cookies for {self.vinted_url} on attempt {attempt}\n Error : {e}"
-            )
-            self.set_cookies(attempt + 1)
+    def _fetch_cookies(self) -> tuple[Cookies, float]:
+        response = self.auth_policy.call(self._post, self.vinted_auth_url, session=self._auth_session,
+                                         on_retry=self._on_retry)
+        expires = [cookie.expires for cookie in response.cookies if cookie.expires]
+        expires_at = min(expires) if expires else time.time() + VINTED_COOKIES_DEFAULT_TTL
+        return response.cookies.get_dict(), expires_at
 
+    def set_cookies(self):
+        """used to set cookies, waits for the refresh in flight instead of starting another one"""
+        self.token_manager.refresh()
 
-requester = VintedRequester()
 
+class AsyncVintedRequester:
+    """
+    asynchronous requester used to perform many http requests to vinted.pl at once.
+    All requests share one pooled aiohttp session; cookies are taken from the token manager
+    of the synchronous requester. Keep one open requester per event loop, so connections are reused.
+    """
+
+    def __init__(self, sync_requester: VintedRequester, concurrency_limit: int):
+        self._sync_requester = sync_requester
+        self._concurrency_limit = concurrency_limit
+        self._token_manager = sync_requester.token_manager
+        self._cookies_generation = None
+        self.policy = sync_requester.policy
+        self.session = None
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(
+            limit=self._concurrency_limit,
+            keepalive_timeout=VINTED_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(
+            headers=HEADERS,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.policy.timeout),
+        )
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def get(self, url, data=None):
+        """
+        Perform a http get request, retried according to the request policy.
+        :param url: str
+        :param data: dict, optional
+        :return: dict
+            Json format
+        :raises CircuitOpenError: if vinted is unavailable
+        """
+        return await self.policy.call_async(self._get, url, data, on_retry=self._on_retry)
+
+    async def _get(self, url, data=None):
+        await self._update_cookies()
+        generation = self._cookies_generation
+        with span('http.get', url=url):
+            async with self.session.get(url, params=data) as response:
+                vinted_http_responses_total.inc(status=response.status)
+                if response.status in AUTH_ERROR_STATUSES:
+                    await self._token_manager.refresh_async(generation)
+                response.raise_for_status()
+                body = await response.read()
+        return loads(body)
+
+    async def _on_retry(self, error: Exception):
+        vinted_http_retries_total.inc()
+        logger.warning(f"Request to {self._sync_requester.vinted_url} failed, retrying: {error}")
+
+    async def _update_cookies(self):
+        """
+        waits for fresh cookies if they are expired and copies new cookies to the session.
+        The cookies are read with snapshot(), which never refreshes them on the event loop thread,
+        even if the refresh this coroutine waited for has failed
+        """
+        await self._token_manager.ensure_fresh_async()
+        cookies, generation = self._token_manager.snapshot()
+        if generation != self._cookies_generation:
+            self.session.cookie_jar.update_cookies(cookies)
+            self._cookies_generation = generation
+
+
+requester = VintedRequester()
@@ -4,19 +4,126 @@ This module contains settings that are used in other modules
 import os
 import pathlib
 
+from decouple import config
+
 
 BASE_DIR = pathlib.Path(__file__).parent
 
 DEBUG = True
 
 
-PARSER_UPDATE_INTERVAL = 5  # minutes
+PARSER_UPDATE_INTERVAL = 5  # minutes, initial poll interval of a category
+
+PARSER_MIN_POLL_INTERVAL = 10  # seconds, poll interval of the hottest categories
+
+PARSER_MAX_POLL_INTERVAL = 60 * 60  # seconds, poll interval of categories without new items
+
+PARSER_TARGET_ITEMS_PER_POLL = 10  # new items a category should have on average when it's polled
+
+PARSER_BACKOFF_FACTOR = 2  # poll interval multiplier after a poll without new items
+
+PARSER_REQUEST_BUDGET = 300  # maximum number of requests to vinted per minute
+
+PARSER_CATEGORIES_REFRESH_INTERVAL = 60  # seconds
+
+PARSER_CONCURRENCY_LIMIT = 20  # maximum number of category requests in flight
 
+PARSER_IN_PROCESS = True  # run the parser in the bot process, False when parser_worker processes run it
+
+PARSER_LEASE_TTL = 3 * 60  # seconds a worker holds its categories without a heartbeat
+
+PARSER_HEARTBEAT_INTERVAL = 30  # seconds between heartbeats of a worker, well below PARSER_LEASE_TTL
+
+
+VINTED_URL = config('VINTED_URL', default='https://www.vinted.pl')  # overridden to run against a local server
 
 VINTED_ITEMS_PER_PAGE = 96
 
+VINTED_MAX_PAGES = 10  # upper bound of pages scanned per category in one cycle
+
+VINTED_REQUEST_TIMEOUT = 15  # seconds
+
+VINTED_RETRY_ATTEMPTS = 4  # attempts of one request, including the first one
+
+VINTED_RETRY_BASE_DELAY = 0.5  # seconds, doubled after every failed attempt
+
+VINTED_RETRY_MAX_DELAY = 10  # seconds
+
+VINTED_CIRCUIT_FAILURE_THRESHOLD = 10  # consecutive failures after which requests to vinted are skipped
+
+VINTED_CIRCUIT_RESET_TIMEOUT = 60  # seconds before vinted is tried again
+
+VINTED_BULK_INGEST_MODE = 'copy'  # 'copy' streams items through a staging table, 'insert' uses one INSERT
+
+VINTED_ITEMS_RETENTION_DAYS = 7  # items older than this are pruned, categories keep their high-water mark
+
+VINTED_ITEMS_PRUNE_BATCH_SIZE = 5000  # rows deleted per transaction
+
+VINTED_ITEMS_PRUNE_INTERVAL = 60 * 60  # seconds between prune runs
+
+VINTED_KEEPALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+
+VINTED_COOKIES_REFRESH_MARGIN = 300  # seconds before expiry when cookies are refreshed in the background
+
+VINTED_COOKIES_DEFAULT_TTL = 60 * 60  # seconds, used when vinted doesn't send an expiry date
+
+VINTED_COOKIES_RETRY_INTERVAL = 30  # seconds between background refresh attempts
+
+
+DELIVERY_TAIL_INTERVAL = 5  # seconds between reads of new items when the parser runs out of process
+
+DELIVERY_TAIL_BATCH_SIZE = 500  # item links read at once when the parser runs out of process
+
+DELIVERY_TRACKING_MODE = 'log'  # 'log' stores every published item, 'cursor' also compacts them into per-category cursors
+
+DELIVERY_CURSOR_SETTLE_TIME = 60  # seconds, cursors never pass items stored more recently, they may not be committed yet
+
+UNPUBLISHED_ITEMS_PAGE_SIZE = 100  # items read per page of unpublished items
+
+PUBLISHED_ITEMS_FLUSH_SIZE = 500  # buffered published items that trigger a write
+
+PUBLISHED_ITEMS_FLUSH_INTERVAL = 5  # seconds between writes of buffered published items
+
+PUBLISHED_ITEMS_MAX_RETRIES = 5  # failed writes in a row after which the buffered published items are dropped
+
+ADMIN_IDS_CACHE_TTL = 300  # seconds
+
+
+METRICS_ENABLED = True
+
+METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+
+METRICS_PORT = config('METRICS_PORT', default=9100, cast=int)  # /metrics is served on this port, 0 disables it
+
+METRICS_WORKER_PORTS = 32  # parser workers serve /metrics on the first free port of the ones after METRICS_PORT
+
+
+TRACING_BUFFER_SIZE = 10000  # latest spans kept in memory
+
+PROFILER_OUTPUT_DIR = os.path.join(BASE_DIR, 'logs', 'profiles')
+
+
+# TELEGRAM
+TG_API_SERVER = config('TG_API_SERVER', default='https://api.telegram.org')  # overridden to run against a local server
+
+TG_SENDER_WORKERS = 20  # number of concurrent senders
+
+TG_GLOBAL_RATE_LIMIT = 30  # messages per second for the whole bot
+
+TG_CHAT_RATE_LIMIT = 1  # messages per second for one chat
+
+TG_CHAT_BURST = 3  # messages that can be sent to one chat at once
+
+TG_SEND_MAX_RETRIES = 3  # retries of a message after a flood control error
+
+TG_ALBUM_DELIVERY = True  # send bursts of items as albums instead of single photos
+
+TG_ALBUM_SIZE = 10  # photos in one album, telegram allows 2-10
+
 
 # LOGGING
+LOG_PROCESS_NAME = config('LOG_PROCESS_NAME', default='')  # added to the log file names, set by every parser worker
+
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
 LOG_DEBUG_FILE_PATH = os.path.join(
@@ -35,5 +142,15 @@ LOG_ERROR_FILE_PATH = os.path.join(
     BASE_DIR, 'logs', 'log_error.log'
 )
 
+LOG_MAX_BYTES = 10 * 1024 * 1024  # size of a log file before it is rotated
+
+LOG_ROTATE_WHEN = None  # e.g. 'midnight' rotates log files by time instead of size
+
+LOG_BACKUP_COUNT = 5  # rotated files kept per log
+
+LOG_RATE_LIMIT = 20  # debug lines per call site and interval, the rest are dropped
+
+LOG_RATE_LIMIT_INTERVAL = 10  # seconds
+
 
 LOG_LEVEL = 'debug'
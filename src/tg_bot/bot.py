@@ -2,17 +2,19 @@
 This module contains telegram bot
 """
 from aiogram import Bot, Dispatcher
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from decouple import config
 from src.tg_bot.filter import IsAdminFilter
 from src.logger import logger
-from src.tg_bot.db_handler import init_engine
+from src.settings import TG_API_SERVER
+from src.tg_bot.db_handler import init_engine, published_item_writer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
 
 API_TOKEN = config('API_TOKEN')
 
-bot = Bot(token=API_TOKEN)
+bot = Bot(token=API_TOKEN, server=TelegramAPIServer.from_base(TG_API_SERVER))
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 dp.middleware.setup(LoggingMiddleware())
@@ -26,6 +28,7 @@ async def on_startup(_):
 
 
 async def on_shutdown(_):
+    await published_item_writer.close()
     await dp.storage.close()
     await dp.storage.wait_closed()
     logger.info("Bot has been stopped")
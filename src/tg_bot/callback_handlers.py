@@ -1,12 +1,11 @@
-import time
-
 from aiogram import types
 from aiogram.types import CallbackQuery
 from aiogram.utils.exceptions import InvalidQueryID
 
-from .bot import dp, bot
+from .bot import dp
 from .keyboards import *
-from .utils import send_new_items_to_user, edit_message_with_keyboard, send_new_item
+from .utils import send_new_items_to_user, edit_message_with_keyboard, send_unpublished_pages
+from .sender import sender
 from .states import NewCategory
 from src.tg_bot.db_handler import get_user_categories, get_categories, add_category_to_user, \
     get_unpublished_items_by_category, delete_user_category, get_users_for_category, delete_category
@@ -54,8 +53,8 @@ async def add_new_category_handler(call: CallbackQuery):
     all_categories = await get_categories()
 
     keyboard = all_categories_keyboard(all_categories)
-    await bot.edit_message_text(chat_id=user_id, message_id=call.message.message_id, text="All categories:",
-                                reply_markup=keyboard)
+    await sender.edit_message_text(user_id, message_id=call.message.message_id, text="All categories:",
+                                   reply_markup=keyboard)
 
     await call.answer()
 
@@ -64,7 +63,7 @@ async def add_new_category_handler(call: CallbackQuery):
 async def add_new_one_handler(call: CallbackQuery):
     user_id = call.from_user.id
 
-    await bot.send_message(chat_id=user_id, text="Please enter the name of the new category you want to add:")
+    await sender.send_message(user_id, text="Please enter the name of the new category you want to add:")
 
     await NewCategory.InputCategoryName.set()
 
@@ -78,7 +77,7 @@ async def add_category_handler(call: CallbackQuery):
 
     await add_category_to_user(user_id, category_id)
 
-    await bot.send_message(chat_id=user_id, text="Category added successfully.")
+    await sender.send_message(user_id, text="Category added successfully.")
 
     await call.answer()
 
@@ -90,16 +89,18 @@ async def category_view_items_handler(call: CallbackQuery):
 
     unpublished_items = await get_unpublished_items_by_category(user_id, category_id)
 
-    if unpublished_items:
-        for item in unpublished_items:
-            await send_new_item(user_id, item)
-            time.sleep(1)
-    else:
-        await bot.send_message(chat_id=user_id, text="No new items in this category.")
+    if not unpublished_items:
+        await sender.send_message(user_id, text="No new items in this category.")
+
+    await send_unpublished_pages(
+        user_id, unpublished_items,
+        lambda after: get_unpublished_items_by_category(user_id, category_id, after=after),
+        category_id,
+    )
 
     user_categories = await get_user_categories(user_id)
     keyboard = categories_keyboard(user_categories)
-    await bot.send_message(chat_id=user_id, text="Your categories:", reply_markup=keyboard)
+    await sender.send_message(user_id, text="Your categories:", reply_markup=keyboard)
 
     try:
         await call.answer()
@@ -125,7 +126,8 @@ async def settings_handler(call: types.CallbackQuery):
 
     keyboard.add(InlineKeyboardButton("Back", callback_data="back_to_menu"))
 
-    await call.message.edit_text("Select a category to delete:", reply_markup=keyboard)
+    await sender.edit_message_text(call.message.chat.id, message_id=call.message.message_id,
+                                   text="Select a category to delete:", reply_markup=keyboard)
     await call.answer()
 
 
@@ -139,5 +141,6 @@ async def delete_category_handler(call: types.CallbackQuery):
     if not users_connected_to_category:
         await delete_category(category_id)
 
-    await call.message.edit_text("Category deleted successfully.", reply_markup=menu_keyboard())
+    await sender.edit_message_text(call.message.chat.id, message_id=call.message.message_id,
+                                   text="Category deleted successfully.", reply_markup=menu_keyboard())
     await call.answer()
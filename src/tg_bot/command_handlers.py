@@ -1,12 +1,17 @@
 from aiogram import types
 from aiogram.dispatcher import filters, FSMContext
 
-from .bot import dp, bot
+from .bot import dp
 from .keyboards import menu_keyboard
 from .db_handler import create_user, is_active, deactivate_user_by_id_async, activate_user_by_id_async,\
     get_user_by_username_async, create_category, add_category_to_user, get_user_by_id_async
+from .sender import sender
 from .states import NewCategory
 from src.logger import logger
+from src.settings import PARSER_IN_PROCESS
+from src.tracing import profiler, spans
+
+MESSAGE_LENGTH_LIMIT = 4096
 
 
 @dp.message_handler(commands=["start"])
@@ -14,16 +19,16 @@ async def cmd_start(message: types.Message):
     user = message.from_user
     existing_user = get_user_by_id_async(user.id)
     if existing_user:
-        await bot.send_message(text="Welcome back!", chat_id=user.id)
-        await message.answer("Here is menu:", reply_markup=menu_keyboard())
+        await sender.send_message(user.id, text="Welcome back!")
+        await sender.answer(message, "Here is menu:", reply_markup=menu_keyboard())
         return
     logger.info(f"New user: {user.id} - {user.username}")
     try:
         await create_user(user)
-        await message.reply("Welcome to the bot!\n Here is menu:", reply_markup=menu_keyboard())
+        await sender.reply(message, "Welcome to the bot!\n Here is menu:", reply_markup=menu_keyboard())
     except Exception as e:
         logger.warning(f"Failed to create user: {e}")
-        await message.reply("An error occurred. Please try again later.")
+        await sender.reply(message, "An error occurred. Please try again later.")
 
 
 @dp.message_handler(commands=['stop'])
@@ -31,9 +36,9 @@ async def cmd_stop(message: types.Message):
     user = message.from_user
     if await is_active(user):
         await deactivate_user_by_id_async(user.id)
-        await message.answer(f"Unsubscribed from Vinted notifications.")
+        await sender.answer(message, f"Unsubscribed from Vinted notifications.")
     else:
-        await message.answer(f"You are already unsubscribed from Vinted notifications.")
+        await sender.answer(message, f"You are already unsubscribed from Vinted notifications.")
 
 
 @dp.message_handler(is_admin=True, commands=["activate"])
@@ -42,14 +47,14 @@ async def cmd_activate(message: types.Message):
     if user_id_or_username.isdigit():
         user_id = int(user_id_or_username)
         await activate_user_by_id_async(user_id)
-        await message.reply(f"User {user_id} has been activated.")
+        await sender.reply(message, f"User {user_id} has been activated.")
     else:
         user = await get_user_by_username_async(user_id_or_username)
         if user:
             await activate_user_by_id_async(user.id)
-            await message.reply(f"User {user.username} has been activated.")
+            await sender.reply(message, f"User {user.username} has been activated.")
         else:
-            await message.reply(f"User {user_id_or_username} not found.")
+            await sender.reply(message, f"User {user_id_or_username} not found.")
 
 
 @dp.message_handler(is_admin=True, commands=["deactivate"])
@@ -58,20 +63,57 @@ async def cmd_deactivate(message: types.Message):
     if user_id_or_username.isdigit():
         user_id = int(user_id_or_username)
         await deactivate_user_by_id_async(user_id)
-        await message.reply(f"User {user_id} has been deactivated.")
+        await sender.reply(message, f"User {user_id} has been deactivated.")
     else:
         user = await get_user_by_username_async(user_id_or_username)
         if user:
             await deactivate_user_by_id_async(user.id)
-            await message.reply(f"User {user.username} has been deactivated.")
+            await sender.reply(message, f"User {user.username} has been deactivated.")
         else:
-            await message.reply(f"User {user_id_or_username} not found.")
+            await sender.reply(message, f"User {user_id_or_username} not found.")
+
+
+@dp.message_handler(is_admin=True, commands=["spans"])
+async def cmd_spans(message: types.Message):
+    """
+    /spans [limit] [name] - slowest recent spans, e.g. /spans 20 parser.query
+    Spans are kept by the process that records them, parser spans of worker processes are not shown.
+    """
+    args = message.get_args().split()
+    limit = int(args.pop(0)) if args and args[0].isdigit() else 10
+    name = args[0] if args else None
+    slowest = spans.slowest(limit, name)
+    note = '' if PARSER_IN_PROCESS else "The parser runs in worker processes, only bot spans are shown.\n"
+    if not slowest:
+        await sender.reply(message, note + "No spans recorded yet.")
+        return
+    text = note + '\n'.join(repr(span) for span in slowest)
+    await sender.reply(message, text[:MESSAGE_LENGTH_LIMIT])
+
+
+@dp.message_handler(is_admin=True, commands=["profile"])
+async def cmd_profile(message: types.Message):
+    """
+    /profile [cycles] - profiles the next parser cycles, /profile off - stops profiling
+    Only available when the parser runs in the bot process.
+    """
+    if not PARSER_IN_PROCESS:
+        await sender.reply(message, "The parser runs in worker processes, profiling is not available from the bot.")
+        return
+    arg = message.get_args().strip()
+    if arg == 'off':
+        profiler.stop()
+        await sender.reply(message, "Profiling stopped, the profile is written after the current cycle.")
+        return
+    cycles = int(arg) if arg.isdigit() else 1
+    profiler.start(cycles)
+    await sender.reply(message, f"Profiling the next {cycles} parser cycles.")
 
 
 @dp.message_handler(commands=["menu"])
 async def menu(message: types.Message):
     keyboard = menu_keyboard()
-    await message.answer("Menu:", reply_markup=keyboard)
+    await sender.answer(message, "Menu:", reply_markup=keyboard)
 
 
 @dp.message_handler(lambda message: message.text, state=NewCategory.InputCategoryName)
@@ -84,7 +126,7 @@ async def new_category_handler(message: types.Message, state: FSMContext):
     await add_category_to_user(user_id, new_category.id)
 
     # Send a confirmation message to the user
-    await bot.send_message(chat_id=user_id, text=f"New category '{category_name}' has been added.")
+    await sender.send_message(user_id, text=f"New category '{category_name}' has been added.")
 
     # Finish the state
     await state.finish()
@@ -1,8 +1,12 @@
 import asyncio
-from typing import List
+import datetime
+import time
+from typing import FrozenSet, List
 from aiogram import types
 from sqlalchemy import create_engine as create_sync_engine
-from sqlalchemy import delete, and_
+from sqlalchemy import delete, and_, exists, func, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,16 +16,28 @@ from decouple import config
 from typing import Optional
 from src.db_client.models import *
 from src.logger import logger
+from src.metrics import db_query_seconds
+from src.tracing import trace_engine
+from src.tg_bot.match_index import match_index
+from src.settings import PUBLISHED_ITEMS_FLUSH_SIZE, PUBLISHED_ITEMS_FLUSH_INTERVAL, ADMIN_IDS_CACHE_TTL, \
+    UNPUBLISHED_ITEMS_PAGE_SIZE, DELIVERY_TRACKING_MODE, DELIVERY_CURSOR_SETTLE_TIME, PUBLISHED_ITEMS_MAX_RETRIES
 
 db_config = f"postgresql+asyncpg://{config('DB_USER')}:{config('DB_PASSWORD')}@{config('DB_HOST')}:{config('DB_PORT')}/{config('DB_NAME')}"
 
 
+def timed_query(func):
+    """
+    Records the duration of every call of a db handler function
+    """
+    return db_query_seconds.time(function=func.__name__)(func)
+
+
 class SessionManager:
     def __init__(self, db_config: str):
         self.async_engine = create_async_engine(db_config)
         self.sync_engine = create_sync_engine(db_config.replace("postgresql+asyncpg", "postgresql"))
         self.async_session = None
-        Base.metadata.create_all(self.sync_engine, checkfirst=True)
+        trace_engine(self.async_engine.sync_engine)
 
     async def init_async_session(self):
         if self.async_session is not None:
@@ -62,7 +78,90 @@ async def get_session() -> AsyncSession:
             raise e
 
 
+class PublishedItemWriter:
+    """
+    Buffers published items and writes them
+    when PUBLISHED_ITEMS_FLUSH_SIZE items are buffered or every PUBLISHED_ITEMS_FLUSH_INTERVAL seconds.
+    Every item is inserted into user_published_items with one multi-row insert, in both tracking modes.
+    A batch that violates a constraint is split until the offending rows are found and dropped,
+    a batch that fails otherwise is retried with the next flush, PUBLISHED_ITEMS_MAX_RETRIES times at most.
+    """
+
+    def __init__(self):
+        self._buffer: List[tuple] = []
+        self._lock = asyncio.Lock()
+        self._flusher = None
+        self._size_flush = None
+        self._failed_flushes = 0
+
+    def add(self, user_id: int, item_id: int):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run())
+        self._buffer.append((user_id, item_id))
+        if len(self._buffer) >= PUBLISHED_ITEMS_FLUSH_SIZE and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+
+    @db_query_seconds.time(function='flush_published_items')
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                await self._write(rows)
+            except Exception as e:
+                self._failed_flushes += 1
+                if self._failed_flushes >= PUBLISHED_ITEMS_MAX_RETRIES:
+                    logger.error(f'Dropped {len(rows)} published items after {self._failed_flushes} failed writes: '
+                                 f'{e}', exc_info=True)
+                    self._failed_flushes = 0
+                    return
+                logger.error(f'Failed to write {len(rows)} published items, retrying with the next flush: {e}',
+                             exc_info=True)
+                self._buffer[:0] = rows
+            else:
+                self._failed_flushes = 0
+
+    async def _write(self, rows: List[tuple]):
+        """
+        Writes the rows in one statement, on a constraint violation writes both halves separately
+        and drops the single rows that still fail, e.g. an item pruned after it was sent
+        """
+        stmt = pg_insert(UserPublishedItem).values(
+            [{'user_id': user_id, 'item_id': item_id} for user_id, item_id in rows]
+        ).on_conflict_do_nothing()
+        try:
+            async with get_session() as session:
+                await session.execute(stmt)
+        except IntegrityError as e:
+            if len(rows) == 1:
+                logger.warning(f'Dropped published item {rows[0]}: {e.orig}')
+                return
+            middle = len(rows) // 2
+            await self._write(rows[:middle])
+            await self._write(rows[middle:])
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(PUBLISHED_ITEMS_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._size_flush is not None:
+            await self._size_flush
+            self._size_flush = None
+        await self.flush()
+
+
+published_item_writer = PublishedItemWriter()
+
+
+@timed_query
 async def create_user(user: types.User) -> None:
+    user_id = user.id
     async with get_session() as session:
         try:
             user = TelegramBotUser(id=user.id, username=user.username, first_name=user.first_name, active=True)
@@ -70,8 +169,10 @@ async def create_user(user: types.User) -> None:
         except Exception as e:
             logger.error(e)
             raise
+    match_index.activate(user_id)
 
 
+@timed_query
 async def is_active(user: types.User) -> bool:
     async with get_session() as session:
         stmt = select(TelegramBotUser).where(TelegramBotUser.id == user.id)
@@ -80,6 +181,7 @@ async def is_active(user: types.User) -> bool:
         return user is not None and user.active
 
 
+@timed_query
 async def get_all_active_users():
     """
     Returns ids of all active users
@@ -91,6 +193,7 @@ async def get_all_active_users():
         return [user.id for user in result.scalars().all()]
 
 
+@timed_query
 async def is_admin_async(user_id: int) -> bool:
     async with get_session() as session:
         stmt = select(AdminUser).where(AdminUser.user_id == user_id)
@@ -99,6 +202,7 @@ async def is_admin_async(user_id: int) -> bool:
         return admin_user is not None and admin_user.is_admin
 
 
+@timed_query
 async def activate_user_by_id_async(user_id: int) -> None:
     async with get_session() as session:
         stmt = select(TelegramBotUser).where(TelegramBotUser.id == user_id)
@@ -107,8 +211,10 @@ async def activate_user_by_id_async(user_id: int) -> None:
         if user:
             user.active = True
             await session.commit()
+            match_index.activate(user_id)
 
 
+@timed_query
 async def deactivate_user_by_id_async(user_id: int) -> None:
     async with get_session() as session:
         stmt = select(TelegramBotUser).where(TelegramBotUser.id == user_id)
@@ -117,8 +223,10 @@ async def deactivate_user_by_id_async(user_id: int) -> None:
         if user:
             user.active = False
             await session.commit()
+            match_index.deactivate(user_id)
 
 
+@timed_query
 async def get_user_by_username_async(username: str) -> Optional[TelegramBotUser]:
     async with get_session() as session:
         stmt = select(TelegramBotUser).where(TelegramBotUser.username == username)
@@ -127,6 +235,7 @@ async def get_user_by_username_async(username: str) -> Optional[TelegramBotUser]
         return user
 
 
+@timed_query
 async def get_user_by_id_async(user_id: int) -> Optional[TelegramBotUser]:
     async with get_session() as session:
         stmt = select(TelegramBotUser).where(TelegramBotUser.id == user_id)
@@ -135,6 +244,7 @@ async def get_user_by_id_async(user_id: int) -> Optional[TelegramBotUser]:
         return user
 
 
+@timed_query
 async def get_admin_users_ids() -> List[int]:
     async with get_session() as session:
         stmt = select(AdminUser).where(AdminUser.is_admin == True)
@@ -142,32 +252,206 @@ async def get_admin_users_ids() -> List[int]:
         return [admin_user.user_id for admin_user in result.scalars().all()]
 
 
-async def get_unpublished_items(user_id: int) -> List[VintedItem]:
+@timed_query
+async def load_match_index() -> None:
+    """
+    Loads all subscriptions and active users into the match index
+    """
+    async with get_session() as session:
+        subscriptions = (await session.execute(select(UserCategory.user_id, UserCategory.category_id))).all()
+        active_user_ids = (await session.execute(select(TelegramBotUser.id).where(TelegramBotUser.active))).scalars()
+        match_index.load(subscriptions, active_user_ids)
+
+
+class AdminIdsCache:
+    """
+    Ids of admin users, reloaded after ADMIN_IDS_CACHE_TTL seconds.
+    The bot never writes admin_users, admins are edited in the database directly,
+    so the TTL is what picks the changes up. Code that changes admin rows should call invalidate().
+    """
+
+    def __init__(self):
+        self._ids = None
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def _is_valid(self) -> bool:
+        return self._ids is not None and time.monotonic() - self._loaded_at < ADMIN_IDS_CACHE_TTL
+
+    async def get(self) -> FrozenSet[int]:
+        if self._is_valid():
+            return self._ids
+        async with self._lock:
+            if not self._is_valid():
+                self._ids = frozenset(await get_admin_users_ids())
+                self._loaded_at = time.monotonic()
+            return self._ids
+
+    def invalidate(self):
+        """
+        Makes the next get() reload the ids
+        """
+        self._ids = None
+
+
+admin_ids_cache = AdminIdsCache()
+
+
+def _not_published_to(user_id: int):
+    """
+    Condition for items that were not sent to the user, the query must be joined with the user's UserCategory
+    through VintedItemCategory.
+    It is an anti-join with the published items served by the user_item_unique index,
+    in the 'cursor' tracking mode only items past the delivery cursor are checked.
+    """
+    not_published = ~exists().where(
+        and_(UserPublishedItem.user_id == user_id, UserPublishedItem.item_id == VintedItem.unique_id)
+    )
+    if DELIVERY_TRACKING_MODE == 'cursor':
+        return and_(VintedItem.id > UserCategory.last_delivered_item_id, not_published)
+    return not_published
+
+
+@timed_query
+async def advance_delivery_cursor(user_id: int, item_id: int, category_id: int = None) -> None:
+    """
+    Moves the delivery cursors of the user's categories, or of one category, to item_id
+    and deletes the published items the cursors of all the user's categories have passed.
+    Does nothing in the 'log' tracking mode.
+    The caller must have delivered every unpublished item of the categories up to item_id.
+    :param user_id: telegram unique id
+    :param item_id: id of the last item of the delivered prefix
+    :param category_id: category id, all the user's categories if None
+    """
+    if DELIVERY_TRACKING_MODE != 'cursor':
+        return
+    await published_item_writer.flush()
     async with get_session() as session:
         stmt = (
-            select(VintedItem)
-            .join(UserCategory, VintedItem.category_id == UserCategory.category_id)
+            update(UserCategory)
+            .where(UserCategory.user_id == user_id)
+            .values(last_delivered_item_id=func.greatest(UserCategory.last_delivered_item_id, item_id))
+        )
+        if category_id is not None:
+            stmt = stmt.where(UserCategory.category_id == category_id)
+        await session.execute(stmt)
+        passed_by_all = (
+            select(func.min(UserCategory.last_delivered_item_id))
+            .where(UserCategory.user_id == user_id)
+            .scalar_subquery()
+        )
+        await session.execute(
+            delete(UserPublishedItem)
+            .where(UserPublishedItem.user_id == user_id)
+            .where(UserPublishedItem.item_id == VintedItem.unique_id)
+            .where(VintedItem.id <= passed_by_all)
+        )
+
+
+@timed_query
+async def compact_delivery_cursor(user_id: int) -> None:
+    """
+    Moves the delivery cursors of the user's categories over the settled items that precede the user's first
+    unpublished item, see advance_delivery_cursor. Used after push delivery, which doesn't send items in id order.
+    Does nothing in the 'log' tracking mode.
+    :param user_id: telegram unique id
+    """
+    if DELIVERY_TRACKING_MODE != 'cursor':
+        return
+    await published_item_writer.flush()
+    async with get_session() as session:
+        first_unpublished = await session.scalar(
+            select(func.min(VintedItem.id))
+            .join(VintedItemCategory, VintedItemCategory.item_id == VintedItem.id)
+            .join(UserCategory, VintedItemCategory.category_id == UserCategory.category_id)
+            .where(and_(UserCategory.user_id == user_id, _not_published_to(user_id)))
+        )
+        # items stored more recently may have neighbours with lower ids that are not committed yet
+        last_settled = await session.scalar(
+            select(func.max(VintedItem.id))
+            .where(VintedItem.created_at < func.now() - datetime.timedelta(seconds=DELIVERY_CURSOR_SETTLE_TIME))
+        )
+    if last_settled is None:
+        return
+    prefix_end = last_settled if first_unpublished is None else min(last_settled, first_unpublished - 1)
+    if prefix_end > 0:
+        await advance_delivery_cursor(user_id, prefix_end)
+
+
+@timed_query
+async def get_unpublished_items(user_id: int, after: int = 0,
+                                limit: int = UNPUBLISHED_ITEMS_PAGE_SIZE) -> List[VintedItem]:
+    """
+    Returns one page of items from the user's categories that were not sent to the user, ordered by id.
+    An item linked to several of the user's categories is returned once.
+    Pass the id of the last item of a page as `after` to get the next one.
+    :param user_id: telegram unique id
+    :param after: id of the last item of the previous page
+    :param limit: page size
+    """
+    await published_item_writer.flush()
+    async with get_session() as session:
+        page = (
+            select(VintedItem.id)
+            .join(VintedItemCategory, VintedItemCategory.item_id == VintedItem.id)
+            .join(UserCategory, VintedItemCategory.category_id == UserCategory.category_id)
             .where(
                 and_(
                     UserCategory.user_id == user_id,
-                    VintedItem.unique_id.notin_(
-                        select(UserPublishedItem.item_id).where(UserPublishedItem.user_id == user_id)
-                    )
+                    VintedItem.id > after,
+                    _not_published_to(user_id),
                 )
             )
-            .order_by(VintedItem.brand_name, VintedItem.price)
+            .distinct()
+            .order_by(VintedItem.id)
+            .limit(limit)
         )
+        stmt = select(VintedItem).where(VintedItem.id.in_(page)).order_by(VintedItem.id)
         result = await session.execute(stmt)
         items = result.scalars().all()
         return items
 
 
-async def add_published_item(user_id: int, item_id: int) -> None:
+@timed_query
+async def claim_pending_items(limit: int) -> List[tuple]:
+    """
+    Takes items stored by the parser workers that wait for push delivery, oldest first,
+    and marks their links delivered. Links claimed by another bot process at the same time are skipped.
+    Items whose delivery fails later are still listed as unpublished to the user.
+    :param limit: maximum number of item links
+    :return: list of (VintedItem, category_id)
+    """
     async with get_session() as session:
-        user_published_item = UserPublishedItem(user_id=user_id, item_id=item_id)
-        session.add(user_published_item)
+        pending = (
+            select(VintedItemCategory.item_id, VintedItemCategory.category_id)
+            .where(VintedItemCategory.pending)
+            .order_by(VintedItemCategory.item_id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        # core table, an ORM update with RETURNING can't be nested in a CTE
+        links = VintedItemCategory.__table__
+        claimed = (
+            update(links)
+            .where(tuple_(links.c.item_id, links.c.category_id).in_(pending))
+            .values(pending=False)
+            .returning(links.c.item_id, links.c.category_id)
+            .cte('claimed')
+        )
+        stmt = (
+            select(VintedItem, claimed.c.category_id)
+            .join(claimed, VintedItem.id == claimed.c.item_id)
+            .order_by(VintedItem.id)
+        )
+        result = await session.execute(stmt)
+        return result.all()
+
+
+async def add_published_item(user_id: int, item_id: int) -> None:
+    published_item_writer.add(user_id, item_id)
 
 
+@timed_query
 async def get_categories() -> List[Category]:
     async with get_session() as session:
         stmt = select(Category)
@@ -176,6 +460,7 @@ async def get_categories() -> List[Category]:
         return categories
 
 
+@timed_query
 async def get_user_categories(user_id: int) -> List[Category]:
     async with get_session() as session:
         stmt = select(Category).join(UserCategory).where(UserCategory.user_id == user_id)
@@ -184,13 +469,7 @@ async def get_user_categories(user_id: int) -> List[Category]:
         return user_categories
 
 
-async def clear_table() -> None:
-    async with get_session() as session:
-        await session.execute(delete(UserPublishedItem))
-        await session.execute(delete(Item))
-        await session.commit()
-
-
+@timed_query
 async def add_category_to_user(user_id: int, category_id: int):
     async with get_session() as session:
         # Check if the user already has the category
@@ -205,8 +484,10 @@ async def add_category_to_user(user_id: int, category_id: int):
             user_category = UserCategory(user_id=user_id, category_id=category_id)
             session.add(user_category)
             await session.commit()
+    match_index.subscribe(user_id, category_id)
 
 
+@timed_query
 async def create_category(category_name: str) -> Category:
     async with get_session() as session:
         category = Category(name=category_name)
@@ -216,21 +497,36 @@ async def create_category(category_name: str) -> Category:
         return category
 
 
-async def get_unpublished_items_by_category(user_id: int, category_id: int) -> List[VintedItem]:
+@timed_query
+async def get_unpublished_items_by_category(user_id: int, category_id: int, after: int = 0,
+                                            limit: int = UNPUBLISHED_ITEMS_PAGE_SIZE) -> List[VintedItem]:
+    """
+    Returns one page of items of the category that were not sent to the user, ordered by id.
+    Pass the id of the last item of a page as `after` to get the next one.
+    :param user_id: telegram unique id
+    :param category_id: category id
+    :param after: id of the last item of the previous page
+    :param limit: page size
+    """
+    await published_item_writer.flush()
     async with get_session() as session:
-        stmt = stmt = (
+        stmt = (
             select(VintedItem)
-            .where(VintedItem.category_id == category_id)
-            .where(VintedItem.unique_id.notin_(
-                select(UserPublishedItem.item_id).where(UserPublishedItem.user_id == user_id)
-            ))
-            .order_by(VintedItem.brand_name, VintedItem.price)
+            .join(VintedItemCategory, VintedItemCategory.item_id == VintedItem.id)
+            .join(UserCategory, and_(UserCategory.category_id == VintedItemCategory.category_id,
+                                     UserCategory.user_id == user_id))
+            .where(VintedItemCategory.category_id == category_id)
+            .where(VintedItem.id > after)
+            .where(_not_published_to(user_id))
+            .order_by(VintedItem.id)
+            .limit(limit)
         )
         result = await session.execute(stmt)
         unpublished_items = result.scalars().all()
         return unpublished_items
 
 
+@timed_query
 async def delete_user_category(user_id: int, category_id: int):
     async with get_session() as session:
         stmt = (
@@ -241,8 +537,10 @@ async def delete_user_category(user_id: int, category_id: int):
         )
         await session.execute(stmt)
         await session.commit()
+    match_index.unsubscribe(user_id, category_id)
 
 
+@timed_query
 async def get_users_for_category(category_id: int) -> List[TelegramBotUser]:
     async with get_session() as session:
         stmt = (
@@ -255,8 +553,10 @@ async def get_users_for_category(category_id: int) -> List[TelegramBotUser]:
         return users
 
 
+@timed_query
 async def delete_category(category_id: int):
     async with get_session() as session:
         stmt = delete(Category).where(Category.id == category_id)
         await session.execute(stmt)
         await session.commit()
+    match_index.remove_category(category_id)
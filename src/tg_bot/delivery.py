@@ -0,0 +1,111 @@
+"""
+This module contains push delivery of newly parsed items to subscribed users
+"""
+import asyncio
+from typing import List
+
+from aiogram import Dispatcher
+
+from .utils import send_new_items
+from src.data_structures import Item
+from src.logger import logger
+from src.settings import PARSER_IN_PROCESS, DELIVERY_TAIL_INTERVAL, DELIVERY_TAIL_BATCH_SIZE, DELIVERY_TRACKING_MODE, \
+    DELIVERY_CURSOR_SETTLE_TIME
+from src.tg_bot.db_handler import load_match_index, claim_pending_items, compact_delivery_cursor
+from src.tg_bot.match_index import match_index
+
+
+class DeliveryService:
+    """
+    Receives batches of inserted items from the parser thread and sends them
+    to the active users subscribed to their categories.
+    When the parser runs in separate worker processes, new items are read from the database instead.
+    In the 'cursor' tracking mode the delivery cursors of the users that got items are moved periodically.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._tail = None
+        self._compactor = None
+        self._pushed_user_ids = set()
+
+    async def on_startup(self, _: Dispatcher):
+        await load_match_index()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        if not PARSER_IN_PROCESS:
+            self._tail = asyncio.create_task(self._tail_items())
+        if DELIVERY_TRACKING_MODE == 'cursor':
+            self._compactor = asyncio.create_task(self._compact_cursors())
+        logger.info('Delivery service has been started')
+
+    async def on_shutdown(self, _: Dispatcher):
+        self._loop = None
+        for task in (self._worker, self._tail, self._compactor):
+            if task is not None:
+                task.cancel()
+        self._worker = self._tail = self._compactor = None
+        logger.info('Delivery service has been stopped')
+
+    def submit(self, items: List[Item]):
+        """
+        Queues items for delivery. Safe to call from any thread.
+        :param items: newly inserted items
+        """
+        loop = self._loop
+        if loop is None:
+            logger.debug(f'Delivery service is not running, {len(items)} items left for manual delivery')
+            return
+        loop.call_soon_threadsafe(self._queue.put_nowait, items)
+
+    async def _run(self):
+        while True:
+            items = await self._queue.get()
+            try:
+                await self._deliver(items)
+            except Exception as e:
+                logger.error(f'Failed to deliver {len(items)} items: {e}', exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _tail_items(self):
+        """
+        Queues items stored by the parser workers that wait for delivery,
+        including the ones stored while the bot was not running
+        """
+        while True:
+            try:
+                rows = await claim_pending_items(DELIVERY_TAIL_BATCH_SIZE)
+            except Exception as e:
+                logger.error(f'Failed to read new items: {e}', exc_info=True)
+                rows = []
+            if rows:
+                self._queue.put_nowait([
+                    Item(**{**item.as_dict(), 'category_id': category_id}) for item, category_id in rows
+                ])
+            if len(rows) < DELIVERY_TAIL_BATCH_SIZE:
+                await asyncio.sleep(DELIVERY_TAIL_INTERVAL)
+
+    async def _compact_cursors(self):
+        """
+        Moves the delivery cursors of the users that got items once the items settled
+        """
+        while True:
+            await asyncio.sleep(DELIVERY_CURSOR_SETTLE_TIME)
+            user_ids, self._pushed_user_ids = self._pushed_user_ids, set()
+            for user_id in user_ids:
+                try:
+                    await compact_delivery_cursor(user_id)
+                except Exception as e:
+                    logger.error(f'Failed to move delivery cursors of user {user_id}: {e}', exc_info=True)
+
+    async def _deliver(self, items: List[Item]):
+        recipients = match_index.match(items)
+        await asyncio.gather(*(send_new_items(user_id, user_items) for user_id, user_items in recipients.items()))
+        self._pushed_user_ids.update(recipients)
+
+
+delivery = DeliveryService()
@@ -1,6 +1,6 @@
 from aiogram.dispatcher.filters import BoundFilter
 from aiogram.types import Message
-from .db_handler import get_admin_users_ids
+from .db_handler import admin_ids_cache
 
 
 class IsAdminFilter(BoundFilter):
@@ -10,6 +10,6 @@ class IsAdminFilter(BoundFilter):
         self.is_admin = is_admin
 
     async def check(self, message: Message) -> bool:
-        admin_ids = await get_admin_users_ids()
+        admin_ids = await admin_ids_cache.get()
         checker = message.from_user.id in admin_ids
         return checker == self.is_admin
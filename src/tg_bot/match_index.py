@@ -0,0 +1,91 @@
+"""
+This module contains the in-memory index of category subscribers
+"""
+from typing import Dict, Iterable, List, Set, Tuple
+
+from src.data_structures import Item
+
+
+class MatchIndex:
+    """
+    Maps categories to the ids of their active subscribers, so an ingested batch
+    is matched to its recipients with dictionary lookups only.
+    It is loaded from the database once and then kept up to date by the db handler functions
+    that change subscriptions and user activity. It is used from the event loop thread only.
+    """
+
+    def __init__(self):
+        self._categories: Dict[int, Set[int]] = {}  # user id -> subscribed category ids
+        self._active: Set[int] = set()
+        self._subscribers: Dict[int, Set[int]] = {}  # category id -> active subscriber ids
+        self._loaded = False
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, subscriptions: Iterable[Tuple[int, int]], active_user_ids: Iterable[int]):
+        """
+        Replaces the index content
+        :param subscriptions: (user_id, category_id) pairs
+        :param active_user_ids: ids of active users
+        """
+        self._categories = {}
+        for user_id, category_id in subscriptions:
+            self._categories.setdefault(user_id, set()).add(category_id)
+        self._active = set(active_user_ids)
+        self._subscribers = {}
+        for user_id in self._active:
+            for category_id in self._categories.get(user_id, ()):
+                self._subscribers.setdefault(category_id, set()).add(user_id)
+        self._loaded = True
+
+    def subscribe(self, user_id: int, category_id: int):
+        self._categories.setdefault(user_id, set()).add(category_id)
+        if user_id in self._active:
+            self._subscribers.setdefault(category_id, set()).add(user_id)
+
+    def unsubscribe(self, user_id: int, category_id: int):
+        self._categories.get(user_id, set()).discard(category_id)
+        self._discard_subscriber(category_id, user_id)
+
+    def activate(self, user_id: int):
+        self._active.add(user_id)
+        for category_id in self._categories.get(user_id, ()):
+            self._subscribers.setdefault(category_id, set()).add(user_id)
+
+    def deactivate(self, user_id: int):
+        self._active.discard(user_id)
+        for category_id in self._categories.get(user_id, ()):
+            self._discard_subscriber(category_id, user_id)
+
+    def remove_category(self, category_id: int):
+        self._subscribers.pop(category_id, None)
+        for categories in self._categories.values():
+            categories.discard(category_id)
+
+    def subscribers(self, category_id: int) -> Set[int]:
+        return self._subscribers.get(category_id, set())
+
+    def match(self, items: Iterable[Item]) -> Dict[int, List[Item]]:
+        """
+        Groups items by their recipients
+        :param items: newly ingested items
+        :return: dict[user.id, list[Item]], every item is given to a user once,
+            even if it was ingested for several categories the user is subscribed to
+        """
+        items_by_user: Dict[int, Dict[int, Item]] = {}
+        for item in items:
+            for user_id in self._subscribers.get(item.category_id, ()):
+                items_by_user.setdefault(user_id, {}).setdefault(item.unique_id, item)
+        return {user_id: list(user_items.values()) for user_id, user_items in items_by_user.items()}
+
+    def _discard_subscriber(self, category_id: int, user_id: int):
+        subscribers = self._subscribers.get(category_id)
+        if subscribers is not None:
+            subscribers.discard(user_id)
+            if not subscribers:
+                del self._subscribers[category_id]
+
+
+match_index = MatchIndex()
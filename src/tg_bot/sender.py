@@ -0,0 +1,179 @@
+"""
+This module contains the central outbound send service for telegram bot
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Set
+
+from aiogram import Dispatcher, types
+from aiogram.utils.exceptions import RetryAfter
+
+from .bot import bot
+from src.logger import logger
+from src.metrics import tg_send_errors_total, tg_send_queue_size, tg_send_retries_total, tg_send_seconds
+from src.rate_limit import TokenBucket
+from src.settings import TG_SENDER_WORKERS, TG_GLOBAL_RATE_LIMIT, TG_CHAT_RATE_LIMIT, TG_CHAT_BURST, \
+    TG_SEND_MAX_RETRIES
+
+
+class SendJob:
+    """
+    Queued bot api call
+    """
+    __slots__ = ('method', 'kwargs', 'future', 'attempt')
+
+    def __init__(self, method: Callable[..., Awaitable], kwargs: dict, future: asyncio.Future):
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.attempt = 0
+
+
+class TelegramSender:
+    """
+    Sends messages with a pool of concurrent workers.
+    Every chat has its own queue, so messages for one chat are sent one at a time and in order.
+    A chat is handed to the workers only when its token bucket allows the next message,
+    so workers never wait on per-chat limits, only on the global one.
+    Flood control errors pause all chats for the requested time and the message is retried.
+    """
+
+    def __init__(self, workers: int = TG_SENDER_WORKERS):
+        self._workers_count = workers
+        self._workers = []
+        self._ready = None  # ids of chats whose next message can be sent now
+        self._global_bucket = TokenBucket(rate=TG_GLOBAL_RATE_LIMIT, capacity=TG_GLOBAL_RATE_LIMIT)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_queues: Dict[int, Deque[SendJob]] = {}
+        self._active_chats: Set[int] = set()
+        self._pending = 0
+
+    def _ensure_started(self):
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._run()) for _ in range(self._workers_count)]
+            logger.info(f'Telegram sender has been started with {self._workers_count} workers')
+
+    async def on_shutdown(self, _: Dispatcher):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._ready = None
+        logger.info('Telegram sender has been stopped')
+
+    @property
+    def queue_size(self) -> int:
+        """
+        number of messages waiting to be sent
+        """
+        return self._pending
+
+    async def send(self, method: Callable[..., Awaitable], chat_id: int, **kwargs):
+        """
+        Queues a bot api call and waits for its result
+        :param method: bot method, e.g. bot.send_photo
+        :param chat_id: telegram chat id
+        :param kwargs: arguments of the method
+        :return: result of the method
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._chat_queues.setdefault(chat_id, deque()).append(SendJob(method, kwargs, future))
+        self._pending += 1
+        if chat_id not in self._active_chats:
+            self._active_chats.add(chat_id)
+            self._schedule(chat_id)
+        start = time.perf_counter()
+        try:
+            return await future
+        finally:
+            tg_send_seconds.observe(time.perf_counter() - start, method=method.__name__)
+
+    async def send_message(self, chat_id: int, **kwargs):
+        return await self.send(bot.send_message, chat_id, **kwargs)
+
+    async def send_photo(self, chat_id: int, **kwargs):
+        return await self.send(bot.send_photo, chat_id, **kwargs)
+
+    async def send_media_group(self, chat_id: int, **kwargs):
+        return await self.send(bot.send_media_group, chat_id, **kwargs)
+
+    async def edit_message_text(self, chat_id: int, **kwargs):
+        return await self.send(bot.edit_message_text, chat_id, **kwargs)
+
+    async def answer(self, message: types.Message, text: str, **kwargs):
+        """
+        Sends a message to the chat of the given one, like message.answer
+        """
+        return await self.send_message(message.chat.id, text=text, **kwargs)
+
+    async def reply(self, message: types.Message, text: str, **kwargs):
+        """
+        Sends a reply to the given message, like message.reply
+        """
+        return await self.send_message(message.chat.id, text=text, reply_to_message_id=message.message_id, **kwargs)
+
+    def _schedule(self, chat_id: int):
+        """
+        Hands the chat to the workers as soon as its token bucket allows the next message
+        """
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = TokenBucket(rate=TG_CHAT_RATE_LIMIT, capacity=TG_CHAT_BURST)
+        delay = self._chat_buckets[chat_id].reserve()
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def _run(self):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._chat_queues[chat_id]
+            job = queue.popleft()
+            try:
+                await self._send(chat_id, job, queue)
+            finally:
+                if queue:
+                    self._schedule(chat_id)
+                else:
+                    del self._chat_queues[chat_id]
+                    self._active_chats.discard(chat_id)
+
+    async def _send(self, chat_id: int, job: SendJob, queue: Deque[SendJob]):
+        if job.future.cancelled():
+            self._pending -= 1
+            return
+
+        await asyncio.sleep(self._global_bucket.reserve())
+        try:
+            result = await job.method(chat_id=chat_id, **job.kwargs)
+        except RetryAfter as e:
+            # flood control applies to the whole bot, every chat waits for it
+            self._global_bucket.hold(e.timeout)
+            if job.attempt < TG_SEND_MAX_RETRIES:
+                logger.warning(f'Flood control for chat {chat_id}, retrying in {e.timeout} seconds')
+                job.attempt += 1
+                tg_send_retries_total.inc()
+                queue.appendleft(job)
+                self._chat_buckets[chat_id].hold(e.timeout)
+                return
+            self._resolve(job, exception=e)
+        except Exception as e:
+            self._resolve(job, exception=e)
+        else:
+            self._resolve(job, result=result)
+
+    def _resolve(self, job: SendJob, result=None, exception: Exception = None):
+        self._pending -= 1
+        if job.future.cancelled():
+            return
+        if exception is not None:
+            tg_send_errors_total.inc(method=job.method.__name__)
+            job.future.set_exception(exception)
+        else:
+            job.future.set_result(result)
+
+
+sender = TelegramSender()
+tg_send_queue_size.set_function(lambda: sender.queue_size)
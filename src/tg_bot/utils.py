@@ -2,16 +2,17 @@
 This module contains logic functions for telegram bot
 """
 import asyncio
-import os
-import shutil
+import datetime
 from decouple import config
 from aiogram import types
-from aiogram.types import ParseMode, InlineKeyboardMarkup
+from aiogram.types import ParseMode, InlineKeyboardMarkup, MediaGroup
 
 from .bot import bot, dp
+from .sender import sender
 from src.logger import logger
 from src.data_structures import Item
-from src.tg_bot.db_handler import get_unpublished_items, add_published_item
+from src.settings import TG_ALBUM_DELIVERY, TG_ALBUM_SIZE, UNPUBLISHED_ITEMS_PAGE_SIZE, DELIVERY_CURSOR_SETTLE_TIME
+from src.tg_bot.db_handler import get_unpublished_items, add_published_item, advance_delivery_cursor
 
 
 # Notification logic
@@ -24,49 +25,127 @@ async def send_new_items_to_user(user_id: int):
     new_items = await get_unpublished_items(user_id)
 
     if not new_items:
-        await bot.send_message(user_id, "There are no new items at the moment.")
-    else:
-        for item in new_items:
-            await send_new_item(user_id, item)
-            await asyncio.sleep(1)
+        await sender.send_message(user_id, text="There are no new items at the moment.")
+        return
 
+    await send_unpublished_pages(user_id, new_items, lambda after: get_unpublished_items(user_id, after=after))
 
-async def send_new_item(user_id: int, item: Item) -> None:
-    message_text = f"<b>{item.title}</b>\n" \
-                   f"Brand: {item.brand_name}\n" \
-                   f"Size: {item.size}\n" \
-                   f"Price: {item.price}Zł\n" \
-                   f"{item.url}"
+
+async def send_unpublished_pages(user_id: int, page: list, next_page, category_id: int = None) -> None:
+    """
+    Sends pages of unpublished items, read from the first one, and moves the delivery cursor
+    over the items delivered without a gap
+    :param user_id: telegram unique id
+    :param page: first page of unpublished items
+    :param next_page: coroutine function that returns the page after the given item id
+    :param category_id: category the pages are read from, all the user's categories if None
+    """
+    contiguous = True
+    while page:
+        delivered = await send_new_items(user_id, page)
+        if contiguous:
+            prefix_end, contiguous = delivered_prefix_end(page, delivered)
+            if prefix_end:
+                await advance_delivery_cursor(user_id, prefix_end, category_id)
+        if len(page) < UNPUBLISHED_ITEMS_PAGE_SIZE:
+            break
+        page = await next_page(page[-1].id)
+
+
+def delivered_prefix_end(page: list, delivered: set) -> tuple:
+    """
+    Finds the end of the delivered prefix of a page of unpublished items.
+    The prefix also stops at items stored less than DELIVERY_CURSOR_SETTLE_TIME ago,
+    items with lower ids may still be committed by other transactions.
+    :param page: items ordered by id
+    :param delivered: unique ids of the delivered items
+    :return: id of the last item of the prefix or None, and whether the whole page is the prefix
+    """
+    settled_before = datetime.datetime.now(datetime.timezone.utc) - \
+        datetime.timedelta(seconds=DELIVERY_CURSOR_SETTLE_TIME)
+    prefix_end = None
+    for item in page:
+        if item.unique_id not in delivered or item.created_at >= settled_before:
+            return prefix_end, False
+        prefix_end = item.id
+    return prefix_end, True
+
+
+async def send_new_items(user_id: int, items: list[Item]) -> set:
+    """
+    Sends items to the user, the sender keeps them in order and within telegram rate limits.
+    With TG_ALBUM_DELIVERY items are grouped into albums of up to TG_ALBUM_SIZE photos.
+    :param user_id: telegram unique id
+    :param items: items to send
+    :return: unique ids of the delivered items
+    """
+    if TG_ALBUM_DELIVERY and len(items) > 1:
+        albums = [items[i:i + TG_ALBUM_SIZE] for i in range(0, len(items), TG_ALBUM_SIZE)]
+        results = await asyncio.gather(*(send_new_items_album(user_id, album) for album in albums))
+        return set().union(*results)
+    results = await asyncio.gather(*(send_new_item(user_id, item) for item in items))
+    return {item.unique_id for item, sent in zip(items, results) if sent}
+
+
+async def send_new_items_album(user_id: int, items: list[Item]) -> set:
+    """
+    Sends items as one album, falls back to single photos if the album can't be sent
+    :param user_id: telegram unique id
+    :param items: at most 10 items
+    :return: unique ids of the delivered items
+    """
+    if len(items) == 1:
+        return {items[0].unique_id} if await send_new_item(user_id, items[0]) else set()
+
+    media = MediaGroup()
+    for item in items:
+        media.attach_photo(item.image_url, caption=item_caption(item), parse_mode=ParseMode.HTML)
 
     try:
-        await bot.send_photo(
-            chat_id=user_id,
+        await sender.send_media_group(user_id, media=media)
+    except Exception as e:
+        logger.warning(f"Error sending album to user {user_id}, sending items one by one: {e}")
+        results = await asyncio.gather(*(send_new_item(user_id, item) for item in items))
+        return {item.unique_id for item, sent in zip(items, results) if sent}
+
+    for item in items:
+        await add_published_item(user_id, item.unique_id)
+    return {item.unique_id for item in items}
+
+
+async def send_new_item(user_id: int, item: Item) -> bool:
+    """
+    :return: True if the item was delivered
+    """
+    try:
+        await sender.send_photo(
+            user_id,
             photo=item.image_url,
-            caption=message_text,
+            caption=item_caption(item),
             parse_mode=ParseMode.HTML,
         )
         await add_published_item(user_id, item.unique_id)
     except Exception as e:
         logger.error(f"Error sending notification to user {user_id}: {e}")
+        return False
+    return True
+
+
+def item_caption(item: Item) -> str:
+    return f"<b>{item.title}</b>\n" \
+           f"Brand: {item.brand_name}\n" \
+           f"Size: {item.size}\n" \
+           f"Price: {item.price}Zł\n" \
+           f"{item.url}"
 
 
 async def edit_message_with_keyboard(message: types.Message, text: str, keyboard: InlineKeyboardMarkup):
     try:
-        await bot.edit_message_text(
-            chat_id=message.chat.id,
+        await sender.edit_message_text(
+            message.chat.id,
             message_id=message.message_id,
             text=text,
             reply_markup=keyboard,
         )
     except Exception as e:
-        logger.error(f"Error editing message for chat_id {chat_id}: {e}")
-
-
-def clear_data():
-    vinted.clear_data()
-    image_dir = os.path.join(
-        BASE_DIR.parent,
-        'images'
-    )
-    shutil.rmtree(image_dir)
-    os.makedirs(image_dir)
+        logger.error(f"Error editing message for chat_id {message.chat.id}: {e}")
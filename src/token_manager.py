@@ -0,0 +1,125 @@
+"""
+This module contains the manager of vinted auth cookies
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Tuple
+
+from src.logger import logger
+
+Cookies = Dict[str, str]
+
+
+class TokenManager:
+    """
+    Keeps auth cookies fresh and shares them between all requester sessions.
+    Cookies are refreshed in the background `refresh_margin` seconds before they expire.
+    Concurrent refresh requests are coalesced into one call, callers that pass the generation
+    of the cookies they used return as soon as newer cookies are available.
+    """
+
+    def __init__(self, fetch_cookies: Callable[[], Tuple[Cookies, float]], refresh_margin: float,
+                 retry_interval: float):
+        """
+        :param fetch_cookies: callable that returns new cookies and their expiry timestamp
+        :param refresh_margin: seconds before expiry when cookies are refreshed
+        :param retry_interval: seconds between background refresh attempts after a failure
+        """
+        self._fetch_cookies = fetch_cookies
+        self._refresh_margin = refresh_margin
+        self._retry_interval = retry_interval
+        self._cookies: Cookies = {}
+        self._expires_at = 0.0
+        self._generation = 0
+        self._refreshing = False
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def generation(self) -> int:
+        """
+        number of successful refreshes, changes every time new cookies are set
+        """
+        return self._generation
+
+    @property
+    def is_expired(self) -> bool:
+        return time.time() >= self._expires_at
+
+    @property
+    def cookies(self) -> Cookies:
+        """
+        returns valid cookies, waits for a refresh if they are expired
+        """
+        if self.is_expired:
+            self.refresh(self._generation)
+        return dict(self._cookies)
+
+    def snapshot(self) -> Tuple[Cookies, int]:
+        """
+        returns the current cookies and their generation without refreshing them, never blocks on i/o
+        """
+        with self._condition:
+            return dict(self._cookies), self._generation
+
+    def refresh(self, stale_generation: int = None):
+        """
+        Refreshes cookies, or waits for the refresh that is already in flight.
+        :param stale_generation: generation of the cookies that failed,
+            nothing is done if they were already replaced
+        """
+        with self._condition:
+            if stale_generation is not None and stale_generation != self._generation:
+                return
+            if self._refreshing:
+                self._condition.wait_for(lambda: not self._refreshing)
+                return
+            self._refreshing = True
+
+        try:
+            cookies, expires_at = self._fetch_cookies()
+            with self._condition:
+                self._cookies = cookies
+                self._expires_at = expires_at
+                self._generation += 1
+            logger.info('Cookies set!')
+        finally:
+            with self._condition:
+                self._refreshing = False
+                self._condition.notify_all()
+
+    async def refresh_async(self, stale_generation: int = None):
+        """
+        Same as refresh, without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.refresh, stale_generation)
+
+    async def ensure_fresh_async(self):
+        if self.is_expired:
+            await self.refresh_async(self._generation)
+
+    def start(self):
+        """
+        Starts the background refresh thread
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='vinted-token-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            wait = self._expires_at - self._refresh_margin - time.time()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+            try:
+                self.refresh(self._generation)
+            except Exception as e:
+                logger.error(f'Failed to refresh cookies: {e}')
+            self._stop.wait(self._retry_interval)
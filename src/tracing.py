@@ -0,0 +1,212 @@
+"""
+This module contains lightweight timing spans and the on-demand profiler of parser cycles
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.logger import logger
+from src.settings import TRACING_BUFFER_SIZE, PROFILER_OUTPUT_DIR
+
+SQL_STATEMENT_LENGTH = 200  # characters of a statement kept in its span
+
+
+class Span:
+    """
+    Timed operation, spans opened inside another span become its children
+    """
+    __slots__ = ('name', 'attributes', 'parent', 'depth', 'started_at', 'duration')
+
+    def __init__(self, name: str, attributes: dict, parent: Optional['Span']):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.started_at = time.time()
+        self.duration = None
+
+    @property
+    def path(self) -> str:
+        """
+        names of the span and all its parents, e.g. parser.cycle/parser.query/http.get
+        """
+        names = []
+        span = self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return '/'.join(reversed(names))
+
+    def __repr__(self):
+        attributes = ' '.join(f'{key}={value}' for key, value in self.attributes.items())
+        return f'{self.duration * 1000:.1f}ms {self.path} {attributes}'.rstrip()
+
+
+class SpanBuffer:
+    """
+    Thread safe ring buffer of the latest finished spans
+    """
+
+    def __init__(self, size: int):
+        self._spans: Deque[Span] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+
+    def slowest(self, limit: int = 10, name: str = None) -> List[Span]:
+        """
+        :param limit: number of spans to return
+        :param name: return only spans with this name
+        :return: list[Span], slowest spans first
+        """
+        with self._lock:
+            spans = [span for span in self._spans if name is None or span.name == name]
+        return sorted(spans, key=lambda span: span.duration, reverse=True)[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+
+spans = SpanBuffer(TRACING_BUFFER_SIZE)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the block and records it in the span buffer
+    :param name: operation name, e.g. http.get
+    :param attributes: values that identify the operation, e.g. url
+    """
+    current = Span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        spans.add(current)
+
+
+def traced(name: str = None):
+    """
+    Decorator that records every call of a function or coroutine function as a span
+    :param name: span name, the qualified function name by default
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_engine(engine: Engine):
+    """
+    Records every statement executed by the engine as a db.statement span
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._trace_span = Span('db.statement', {'sql': ' '.join(statement.split())[:SQL_STATEMENT_LENGTH]},
+                                   _current_span.get())
+        context._trace_start = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        current = getattr(context, '_trace_span', None)
+        if current is not None:
+            current.duration = time.perf_counter() - context._trace_start
+            spans.add(current)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+class CycleProfiler:
+    """
+    Profiles the next N parser cycles with cProfile and writes the stats to PROFILER_OUTPUT_DIR.
+    Can be turned on and off from any thread, it takes effect at the start of the next cycle.
+    """
+
+    def __init__(self, output_dir: str = PROFILER_OUTPUT_DIR):
+        self._output_dir = output_dir
+        self._remaining_cycles = 0
+        self._profile = None
+        self._lock = threading.Lock()
+
+    @property
+    def remaining_cycles(self) -> int:
+        return self._remaining_cycles
+
+    def start(self, cycles: int):
+        with self._lock:
+            self._remaining_cycles = cycles
+
+    def stop(self):
+        with self._lock:
+            self._remaining_cycles = 0
+
+    @contextmanager
+    def cycle(self):
+        """
+        Profiles the block if profiling was requested
+        """
+        with self._lock:
+            enabled = self._remaining_cycles > 0
+            stopped = not enabled and self._profile is not None
+            if enabled and self._profile is None:
+                self._profile = cProfile.Profile()
+        if stopped:
+            self._dump()
+        if not enabled:
+            yield
+            return
+
+        self._profile.enable()
+        try:
+            yield
+        finally:
+            self._profile.disable()
+            with self._lock:
+                self._remaining_cycles -= 1
+                finished = self._remaining_cycles <= 0
+            if finished:
+                self._dump()
+
+    def _dump(self):
+        profile, self._profile = self._profile, None
+        os.makedirs(self._output_dir, exist_ok=True)
+        path = os.path.join(self._output_dir, f'parser_{time.strftime("%Y%m%d_%H%M%S")}.prof')
+        profile.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats('cumulative').print_stats(40)
+        with open(path.replace('.prof', '.txt'), 'w', encoding='utf-8') as file:
+            file.write(summary.getvalue())
+        logger.info(f'Parser profile has been written to {path}')
+
+
+profiler = CycleProfiler()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# parser scripts run from src/ and import its modules without the src prefix
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# bot modules read their connection settings on import, the tests never connect
+for name, value in {'DB_USER': 'test', 'DB_PASSWORD': 'test', 'DB_HOST': 'localhost', 'DB_PORT': '5432',
+                    'DB_NAME': 'test', 'API_TOKEN': '123456:test'}.items():
+    os.environ.setdefault(name, value)
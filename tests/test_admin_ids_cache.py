@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from src.tg_bot import db_handler
+from src.tg_bot.db_handler import AdminIdsCache
+
+
+class FakeAdmins:
+    def __init__(self, ids):
+        self.ids = ids
+        self.loads = 0
+
+    async def get_admin_users_ids(self):
+        self.loads += 1
+        await asyncio.sleep(0)
+        return list(self.ids)
+
+
+@pytest.fixture
+def admins(monkeypatch):
+    admins = FakeAdmins([1, 2])
+    monkeypatch.setattr(db_handler, 'get_admin_users_ids', admins.get_admin_users_ids)
+    return admins
+
+
+def _get(cache, times=1):
+    async def run():
+        return await asyncio.gather(*(cache.get() for _ in range(times)))
+    return asyncio.run(run())
+
+
+def test_ids_are_cached_within_ttl(admins, monkeypatch):
+    monkeypatch.setattr(db_handler, 'ADMIN_IDS_CACHE_TTL', 3600)
+    cache = AdminIdsCache()
+    assert _get(cache) == [frozenset({1, 2})]
+    admins.ids = [3]
+    assert _get(cache) == [frozenset({1, 2})]
+    assert admins.loads == 1
+
+
+def test_ids_are_reloaded_after_ttl(admins, monkeypatch):
+    monkeypatch.setattr(db_handler, 'ADMIN_IDS_CACHE_TTL', 0)
+    cache = AdminIdsCache()
+    _get(cache)
+    admins.ids = [3]
+    assert _get(cache) == [frozenset({3})]
+    assert admins.loads == 2
+
+
+def test_invalidate_reloads_ids(admins, monkeypatch):
+    monkeypatch.setattr(db_handler, 'ADMIN_IDS_CACHE_TTL', 3600)
+    cache = AdminIdsCache()
+    _get(cache)
+    admins.ids = [3]
+    cache.invalidate()
+    assert _get(cache) == [frozenset({3})]
+
+
+def test_concurrent_gets_load_once(admins, monkeypatch):
+    monkeypatch.setattr(db_handler, 'ADMIN_IDS_CACHE_TTL', 3600)
+    assert _get(AdminIdsCache(), times=10) == [frozenset({1, 2})] * 10
+    assert admins.loads == 1
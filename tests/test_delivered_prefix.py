@@ -0,0 +1,33 @@
+import datetime
+
+from src.db_client.models import VintedItem
+from src.settings import DELIVERY_CURSOR_SETTLE_TIME
+from src.tg_bot.utils import delivered_prefix_end
+
+SETTLED = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=DELIVERY_CURSOR_SETTLE_TIME + 60)
+RECENT = datetime.datetime.now(datetime.timezone.utc)
+
+
+def _page(*created_at):
+    return [VintedItem(id=item_id, unique_id=100 + item_id, created_at=stored_at)
+            for item_id, stored_at in enumerate(created_at, start=1)]
+
+
+def test_whole_delivered_page_is_the_prefix():
+    page = _page(SETTLED, SETTLED, SETTLED)
+    assert delivered_prefix_end(page, {101, 102, 103}) == (3, True)
+
+
+def test_prefix_stops_before_the_first_gap():
+    page = _page(SETTLED, SETTLED, SETTLED)
+    assert delivered_prefix_end(page, {101, 103}) == (1, False)
+
+
+def test_prefix_stops_before_recent_items():
+    page = _page(SETTLED, RECENT, SETTLED)
+    assert delivered_prefix_end(page, {101, 102, 103}) == (1, False)
+
+
+def test_no_prefix_if_first_item_was_not_delivered():
+    page = _page(SETTLED, SETTLED)
+    assert delivered_prefix_end(page, {102}) == (None, False)
@@ -0,0 +1,33 @@
+import logging
+import time
+
+from src.logger import RateLimitFilter
+
+
+def _record(lineno=10, msg='message'):
+    return logging.LogRecord('test', logging.DEBUG, 'module.py', lineno, msg, None, None)
+
+
+def test_records_above_limit_are_dropped_per_call_site():
+    rate_limit = RateLimitFilter(limit=3, interval=3600)
+    assert [rate_limit.filter(_record()) for _ in range(5)] == [True, True, True, False, False]
+    assert rate_limit.filter(_record(lineno=11))
+
+
+def test_first_record_of_next_window_counts_dropped_records():
+    rate_limit = RateLimitFilter(limit=1, interval=0.05)
+    for _ in range(4):
+        rate_limit.filter(_record())
+    time.sleep(0.06)
+    record = _record()
+    assert rate_limit.filter(record)
+    assert record.msg == 'message (3 similar messages dropped)'
+
+
+def test_window_without_drops_leaves_message_as_is():
+    rate_limit = RateLimitFilter(limit=2, interval=0.05)
+    rate_limit.filter(_record())
+    time.sleep(0.06)
+    record = _record()
+    assert rate_limit.filter(record)
+    assert record.msg == 'message'
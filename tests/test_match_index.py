@@ -0,0 +1,54 @@
+from src.data_structures import Item
+from src.tg_bot.match_index import MatchIndex
+
+
+def _index(subscriptions, active_user_ids):
+    index = MatchIndex()
+    index.load(subscriptions, active_user_ids)
+    return index
+
+
+def test_load_indexes_active_subscribers_only():
+    index = _index([(1, 10), (2, 10), (2, 20)], [1])
+    assert index.loaded
+    assert index.subscribers(10) == {1}
+    assert index.subscribers(20) == set()
+
+
+def test_match_groups_items_by_user():
+    index = _index([(1, 10), (2, 20)], [1, 2])
+    items = [Item(unique_id=1, category_id=10), Item(unique_id=2, category_id=20), Item(unique_id=3, category_id=30)]
+    assert index.match(items) == {1: [items[0]], 2: [items[1]]}
+
+
+def test_match_gives_item_of_equivalent_categories_once():
+    index = _index([(1, 10), (1, 11), (2, 11)], [1, 2])
+    items = [Item(unique_id=1, category_id=10), Item(unique_id=1, category_id=11)]
+    assert index.match(items) == {1: [items[0]], 2: [items[1]]}
+
+
+def test_activate_and_deactivate():
+    index = _index([(1, 10)], [])
+    index.activate(1)
+    assert index.subscribers(10) == {1}
+    index.deactivate(1)
+    assert index.subscribers(10) == set()
+
+
+def test_subscribe_of_inactive_user_is_kept_until_activation():
+    index = _index([], [])
+    index.subscribe(1, 10)
+    assert index.subscribers(10) == set()
+    index.activate(1)
+    assert index.subscribers(10) == {1}
+
+
+def test_unsubscribe_and_remove_category():
+    index = _index([(1, 10), (1, 20), (2, 20)], [1, 2])
+    index.unsubscribe(1, 10)
+    assert index.subscribers(10) == set()
+    index.remove_category(20)
+    assert index.subscribers(20) == set()
+    index.deactivate(1)
+    index.activate(1)
+    assert index.match([Item(unique_id=1, category_id=20)]) == {}
@@ -0,0 +1,67 @@
+import pytest
+
+from parser_scheduler import AdaptivePollScheduler, CategoryPollState, RATE_SMOOTHING
+from settings import PARSER_BACKOFF_FACTOR, PARSER_MAX_POLL_INTERVAL, PARSER_MIN_POLL_INTERVAL, PARSER_REQUEST_BUDGET, \
+    PARSER_TARGET_ITEMS_PER_POLL
+from src.db_client.models import Category
+
+
+@pytest.fixture
+def scheduler():
+    return AdaptivePollScheduler(parser=None, category_source=lambda: [])
+
+
+def test_poll_without_items_backs_off(scheduler):
+    state = CategoryPollState(interval=100, next_poll_at=0, last_poll_at=0)
+    scheduler._update_state(state, new_items=0, now=100)
+    assert state.interval == 100 * PARSER_BACKOFF_FACTOR
+    assert state.last_poll_at == 100
+    assert state.next_poll_at == 100 + state.interval
+
+
+def test_backoff_is_capped(scheduler):
+    state = CategoryPollState(interval=PARSER_MAX_POLL_INTERVAL, next_poll_at=0, last_poll_at=0)
+    scheduler._update_state(state, new_items=0, now=100)
+    assert state.interval == PARSER_MAX_POLL_INTERVAL
+
+
+def test_interval_follows_smoothed_arrival_rate(scheduler):
+    state = CategoryPollState(interval=300, next_poll_at=0, last_poll_at=0, arrival_rate=0.01)
+    scheduler._update_state(state, new_items=30, now=300)
+    rate = RATE_SMOOTHING * 30 / 300 + (1 - RATE_SMOOTHING) * 0.01
+    assert state.arrival_rate == pytest.approx(rate)
+    assert state.interval == pytest.approx(PARSER_TARGET_ITEMS_PER_POLL / rate)
+
+
+def test_hot_category_is_polled_at_min_interval(scheduler):
+    state = CategoryPollState(interval=300, next_poll_at=0, last_poll_at=0, arrival_rate=100)
+    scheduler._update_state(state, new_items=1000, now=10)
+    assert state.interval == PARSER_MIN_POLL_INTERVAL
+
+
+def test_first_poll_with_items_keeps_interval(scheduler):
+    state = CategoryPollState(interval=300, next_poll_at=0)
+    scheduler._update_state(state, new_items=5, now=100)
+    assert state.arrival_rate == 0
+    assert state.interval == 300
+
+
+def test_equivalent_categories_are_polled_together_for_one_request():
+    categories = [Category(id=1, name='Nike'), Category(id=2, name='nike'), Category(id=3, name='Adidas')]
+    scheduler = AdaptivePollScheduler(parser=None, category_source=lambda: categories)
+    scheduler._refresh_categories(now=0)
+    due, paid = scheduler._due_categories(now=0)
+    assert sorted(category.id for category in due) == [1, 2, 3]
+    assert paid == 2
+
+
+def test_request_budget_is_split_between_workers():
+    workers = [1]
+    scheduler = AdaptivePollScheduler(parser=None, category_source=lambda: [], workers_count=lambda: workers[0])
+    scheduler._refresh_categories(now=0)
+    assert scheduler._budget.capacity == PARSER_REQUEST_BUDGET
+    workers[0] = 4
+    scheduler._refresh_categories(now=60)
+    assert scheduler._budget.capacity == PARSER_REQUEST_BUDGET / 4
+    assert scheduler._budget.rate == pytest.approx(PARSER_REQUEST_BUDGET / 4 / 60)
+    assert scheduler._budget.available <= PARSER_REQUEST_BUDGET / 4
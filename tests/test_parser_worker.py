@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import parser_worker
+from parser_worker import LeasedCategories
+
+
+class FakeLeaseDb:
+    """
+    In-memory stand-in for the lease functions of VintedDbClient, leases never expire
+    """
+
+    def __init__(self, category_ids):
+        self.category_ids = list(category_ids)
+        self.leases = {}  # category id -> worker id
+        self.workers = set()
+        self.heartbeats = 0
+
+    def heartbeat(self, worker_id, lease_seconds):
+        self.heartbeats += 1
+        self.workers.add(worker_id)
+        return [category_id for category_id, holder in self.leases.items() if holder == worker_id]
+
+    def lease_counts(self):
+        return len(self.category_ids), len(self.workers)
+
+    def claim_categories(self, worker_id, limit, lease_seconds):
+        claimed = [category_id for category_id in self.category_ids if category_id not in self.leases][:limit]
+        for category_id in claimed:
+            self.leases[category_id] = worker_id
+        return claimed
+
+    def release_leases(self, worker_id, category_ids=None):
+        for category_id, holder in list(self.leases.items()):
+            if holder == worker_id and (category_ids is None or category_id in category_ids):
+                del self.leases[category_id]
+        if category_ids is None:
+            self.workers.discard(worker_id)
+
+    def get_categories(self, category_ids):
+        return set(category_ids)
+
+
+class FakeParser:
+    def __init__(self, db_client):
+        self.db_client = db_client
+
+    def run_db_sync(self, func, *args):
+        return func(*args)
+
+
+@pytest.fixture
+def db():
+    return FakeLeaseDb(range(1, 11))
+
+
+def test_single_worker_takes_all_categories(db):
+    assert LeasedCategories(FakeParser(db), 'w1')() == set(range(1, 11))
+
+
+def test_joining_worker_gets_fair_share(db):
+    w1 = LeasedCategories(FakeParser(db), 'w1')
+    w2 = LeasedCategories(FakeParser(db), 'w2')
+    w1()
+    assert w2() == set()  # counted from its first refresh, everything is still leased
+    assert len(w1()) == 5
+    assert len(w2()) == 5
+    assert w1.workers_count == w2.workers_count == 2
+    assert w1() | w2() == set(range(1, 11))
+
+
+def test_released_categories_are_taken_over(db):
+    w1 = LeasedCategories(FakeParser(db), 'w1')
+    w2 = LeasedCategories(FakeParser(db), 'w2')
+    for worker in (w1, w2, w1, w2):
+        worker()
+    w2.release()
+    assert w1() == set(range(1, 11))
+    assert db.workers == {'w1'}
+
+
+def test_heartbeats_are_sent_between_refreshes(db, monkeypatch):
+    monkeypatch.setattr(parser_worker, 'PARSER_HEARTBEAT_INTERVAL', 0.01)
+    leases = LeasedCategories(FakeParser(db), 'w1')
+    leases.start()
+    deadline = time.monotonic() + 5
+    while db.heartbeats < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    leases.release()
+    assert db.heartbeats >= 3
+    assert db.workers == set()
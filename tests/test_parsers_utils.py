@@ -0,0 +1,24 @@
+from src.data_structures import CategoryQuery
+from src.db_client.models import Category
+from src.parsers.utils import category_query, group_categories, normalize_search_text
+
+
+def test_normalize_search_text():
+    assert normalize_search_text(' Nike  Air\tMax ') == 'nike air max'
+
+
+def test_category_query_ignores_missing_brand():
+    assert category_query(Category(id=1, name='Nike Air', brand_id=0)) == CategoryQuery('nike air', None)
+
+
+def test_group_categories_groups_equivalent_categories_sorted_by_id():
+    categories = [
+        Category(id=3, name='nike  air', brand_id=None),
+        Category(id=1, name='Nike Air', brand_id=None),
+        Category(id=2, name='Nike Air', brand_id=53),
+    ]
+    groups = group_categories(categories)
+    assert {query: [category.id for category in group] for query, group in groups.items()} == {
+        CategoryQuery('nike air', None): [1, 3],
+        CategoryQuery('nike air', 53): [2],
+    }
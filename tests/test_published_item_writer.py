@@ -0,0 +1,94 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src.settings import PUBLISHED_ITEMS_MAX_RETRIES
+from src.tg_bot import db_handler
+from src.tg_bot.db_handler import PublishedItemWriter
+
+PRUNED_ITEM_ID = 666  # violates the foreign key, like an item pruned after it was sent
+
+
+class FakeDatabase:
+    """
+    Records the rows of every insert of published items, fails like postgres would
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.statements = 0
+        self.rows = []
+
+    @asynccontextmanager
+    async def session(self):
+        yield self
+
+    async def execute(self, stmt):
+        self.statements += 1
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        rows = [(params[f'user_id_m{i}'], params[f'item_id_m{i}']) for i in range(len(params) // 2)]
+        if self.error is not None:
+            raise self.error
+        if any(item_id == PRUNED_ITEM_ID for _, item_id in rows):
+            raise IntegrityError('INSERT INTO user_published_items', {}, Exception('foreign key violation'))
+        self.rows += rows
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(db_handler, 'get_session', database.session)
+    return database
+
+
+def _flush(writer, rows):
+    async def run():
+        for user_id, item_id in rows:
+            writer.add(user_id, item_id)
+        await writer.close()
+    asyncio.run(run())
+
+
+def test_rows_are_written_in_one_statement(database):
+    _flush(PublishedItemWriter(), [(1, 1), (1, 2), (2, 1)])
+    assert database.statements == 1
+    assert database.rows == [(1, 1), (1, 2), (2, 1)]
+
+
+def test_violating_row_is_isolated_by_the_split(database):
+    rows = [(1, 1), (1, 2), (1, PRUNED_ITEM_ID), (1, 3), (1, 4)]
+    _flush(PublishedItemWriter(), rows)
+    assert sorted(database.rows) == [(1, 1), (1, 2), (1, 3), (1, 4)]
+    assert database.statements < 2 * len(rows)
+
+
+def test_failed_write_is_retried_with_the_next_flush(database):
+    writer = PublishedItemWriter()
+    database.error = OperationalError('INSERT', {}, Exception('connection lost'))
+
+    async def run():
+        writer.add(1, 1)
+        await writer.flush()
+        database.error = None
+        writer.add(1, 2)
+        await writer.close()
+    asyncio.run(run())
+    assert database.rows == [(1, 1), (1, 2)]
+
+
+def test_rows_are_dropped_after_max_retries(database):
+    writer = PublishedItemWriter()
+    database.error = OperationalError('INSERT', {}, Exception('connection lost'))
+
+    async def run():
+        writer.add(1, 1)
+        for _ in range(PUBLISHED_ITEMS_MAX_RETRIES):
+            await writer.flush()
+        database.error = None
+        await writer.close()
+    asyncio.run(run())
+    assert database.statements == PUBLISHED_ITEMS_MAX_RETRIES
+    assert database.rows == []
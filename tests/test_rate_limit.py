@@ -0,0 +1,43 @@
+import pytest
+
+from src.rate_limit import TokenBucket
+
+
+def test_try_acquire_takes_available_tokens_only():
+    bucket = TokenBucket(rate=0.001, capacity=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_reserve_returns_no_wait_while_tokens_are_available():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+
+
+def test_reserve_queues_callers_behind_each_other():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+    assert bucket.reserve(tokens=3) == pytest.approx(0.5, abs=0.01)
+
+
+def test_consume_puts_bucket_into_debt():
+    bucket = TokenBucket(rate=0.001, capacity=2)
+    bucket.consume(5)
+    assert bucket.available == pytest.approx(-3, abs=0.01)
+    assert not bucket.try_acquire()
+
+
+def test_set_rate_drops_tokens_above_new_capacity():
+    bucket = TokenBucket(rate=0.001, capacity=10)
+    bucket.set_rate(rate=0.001, capacity=2)
+    assert bucket.available == pytest.approx(2, abs=0.01)
+
+
+def test_hold_delays_the_next_token():
+    bucket = TokenBucket(rate=10, capacity=5)
+    bucket.hold(0.5)
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from src.request_policy import CircuitBreaker, CircuitOpenError, RequestPolicy
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class ClientError(Exception):
+    pass
+
+
+def _policy(max_attempts=3, failure_threshold=10, reset_timeout=60, **kwargs):
+    return RequestPolicy(
+        max_attempts=max_attempts, base_delay=0, max_delay=0, timeout=1,
+        circuit_breaker=CircuitBreaker(failure_threshold, reset_timeout), **kwargs
+    )
+
+
+def _failing(errors):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return 'ok'
+    return func, calls
+
+
+def test_circuit_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_circuit_lets_one_trial_through_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    assert not breaker.is_open
+    breaker.before_request()
+
+
+def test_failed_trial_opens_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.is_open
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_call_retries_until_success():
+    func, calls = _failing([UpstreamError(), UpstreamError()])
+    retried = []
+    assert _policy().call(func, on_retry=retried.append) == 'ok'
+    assert len(calls) == 3
+    assert len(retried) == 2
+
+
+def test_call_raises_after_last_attempt():
+    func, calls = _failing([UpstreamError()] * 3)
+    with pytest.raises(UpstreamError):
+        _policy().call(func)
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_or_count_client_errors():
+    policy = _policy(
+        failure_threshold=2,
+        is_failure=lambda e: isinstance(e, UpstreamError),
+        is_retryable=lambda e: isinstance(e, UpstreamError),
+        is_response=lambda e: isinstance(e, ClientError),
+    )
+    for _ in range(5):
+        func, calls = _failing([ClientError()])
+        with pytest.raises(ClientError):
+            policy.call(func)
+        assert len(calls) == 1
+    assert not policy.circuit_breaker.is_open
+
+
+def test_call_stops_retrying_when_circuit_opens():
+    func, calls = _failing([UpstreamError()] * 5)
+    with pytest.raises(UpstreamError):
+        _policy(max_attempts=5, failure_threshold=2).call(func)
+    assert len(calls) == 2
+
+
+def test_call_fails_fast_while_circuit_is_open():
+    policy = _policy(failure_threshold=1)
+    policy.circuit_breaker.record_failure()
+    func, calls = _failing([])
+    with pytest.raises(CircuitOpenError):
+        policy.call(func)
+    assert not calls
+
+
+def test_call_async_retries_until_success():
+    errors = [UpstreamError()]
+    calls = []
+
+    async def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return 'ok'
+
+    assert asyncio.run(_policy().call_async(func)) == 'ok'
+    assert len(calls) == 2
+
+
+def test_client_error_resets_failure_count():
+    policy = _policy(failure_threshold=2, is_failure=lambda e: isinstance(e, UpstreamError),
+                     is_retryable=lambda e: False, is_response=lambda e: isinstance(e, ClientError))
+    policy.circuit_breaker.record_failure()
+    with pytest.raises(ClientError):
+        policy.call(_failing([ClientError()])[0])
+    policy.circuit_breaker.record_failure()
+    assert not policy.circuit_breaker.is_open
+
+
+def test_circuit_open_error_of_a_dependency_is_not_a_success():
+    policy = _policy(max_attempts=3, failure_threshold=2, is_failure=lambda e: isinstance(e, UpstreamError))
+    policy.circuit_breaker.record_failure()
+    func, calls = _failing([CircuitOpenError()])
+    with pytest.raises(CircuitOpenError):
+        policy.call(func)
+    assert len(calls) == 1
+    policy.circuit_breaker.record_failure()
+    assert policy.circuit_breaker.is_open
+
+
+def test_error_without_response_frees_the_trial():
+    policy = _policy(failure_threshold=1, reset_timeout=0, is_failure=lambda e: isinstance(e, UpstreamError))
+    policy.circuit_breaker.record_failure()
+    with pytest.raises(ValueError):
+        policy.call(_failing([ValueError()])[0])
+    assert policy.circuit_breaker.is_open
+    assert policy.call(_failing([])[0]) == 'ok'
+    assert not policy.circuit_breaker.is_open
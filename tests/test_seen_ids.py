@@ -0,0 +1,29 @@
+from src.db_client.seen_ids import SeenIdCache
+
+
+def test_load_replaces_content():
+    cache = SeenIdCache()
+    assert not cache.loaded
+    cache.add([1])
+    cache.load([2, 3])
+    assert cache.loaded
+    assert 1 not in cache
+    assert 2 in cache and 3 in cache
+    assert len(cache) == 2
+
+
+def test_add_and_discard():
+    cache = SeenIdCache()
+    cache.load([1])
+    cache.add([2, 3])
+    cache.discard([1, 3, 4])
+    assert 2 in cache
+    assert len(cache) == 1
+
+
+def test_clear_keeps_cache_loaded():
+    cache = SeenIdCache()
+    cache.load([1, 2])
+    cache.clear()
+    assert cache.loaded
+    assert len(cache) == 0
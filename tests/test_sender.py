@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from aiogram.utils.exceptions import RetryAfter
+
+from src.settings import TG_CHAT_BURST
+from src.tg_bot.sender import TelegramSender
+
+
+class FakeChat:
+    """
+    Bot method that records the messages it gets, the first `flood` calls fail with flood control
+    """
+
+    def __init__(self, flood=0, retry_after=0.05):
+        self.flood = flood
+        self.retry_after = retry_after
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if self.flood:
+            self.flood -= 1
+            raise RetryAfter(self.retry_after)
+        self.sent.append((chat_id, text))
+        return text
+
+
+def _send_all(sender, method, messages):
+    async def run():
+        try:
+            return await asyncio.gather(*(sender.send(method, chat_id, text=text) for chat_id, text in messages))
+        finally:
+            await sender.on_shutdown(None)
+    return asyncio.run(run())
+
+
+def test_messages_of_a_chat_are_sent_in_order():
+    chat = FakeChat()
+    messages = [(1, str(i)) for i in range(TG_CHAT_BURST)] + [(2, 'other')]
+    assert _send_all(TelegramSender(workers=3), chat.send_message, messages) == [text for _, text in messages]
+    assert [text for chat_id, text in chat.sent if chat_id == 1] == [str(i) for i in range(TG_CHAT_BURST)]
+
+
+def test_flood_control_is_retried_and_holds_back_every_chat():
+    chat = FakeChat(flood=1, retry_after=0.2)
+    sender = TelegramSender(workers=2)
+
+    async def run():
+        flooded = asyncio.create_task(sender.send(chat.send_message, 1, text='first'))
+        await asyncio.sleep(0.05)
+        start = time.monotonic()
+        await sender.send(chat.send_message, 2, text='other')
+        waited = time.monotonic() - start
+        await flooded
+        await sender.on_shutdown(None)
+        return waited
+    assert asyncio.run(run()) > 0.1
+    assert sorted(chat.sent) == [(1, 'first'), (2, 'other')]
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+
+from src.token_manager import TokenManager
+
+
+class FakeAuth:
+    """
+    Hands out numbered cookies, every fetch blocks until `release` is set
+    """
+
+    def __init__(self, lifetime: float = 3600):
+        self.lifetime = lifetime
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_cookies(self):
+        self.calls += 1
+        self.release.wait(5)
+        return {'session': str(self.calls)}, time.time() + self.lifetime
+
+
+def _manager(auth):
+    return TokenManager(auth.fetch_cookies, refresh_margin=60, retry_interval=1)
+
+
+def test_concurrent_stale_refreshes_fetch_once():
+    auth = FakeAuth()
+    auth.release.clear()
+    manager = _manager(auth)
+    threads = [threading.Thread(target=manager.refresh, args=(0,)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    auth.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert auth.calls == 1
+    assert manager.snapshot() == ({'session': '1'}, 1)
+
+
+def test_refresh_of_replaced_generation_does_nothing():
+    auth = FakeAuth()
+    manager = _manager(auth)
+    manager.refresh(0)
+    manager.refresh(0)
+    assert auth.calls == 1
+    manager.refresh(1)
+    assert auth.calls == 2
+
+
+def test_concurrent_async_refreshes_fetch_once():
+    auth = FakeAuth()
+    manager = _manager(auth)
+
+    async def run():
+        await asyncio.gather(*(manager.refresh_async(0) for _ in range(10)))
+    asyncio.run(run())
+    assert auth.calls == 1
+
+
+def test_cookies_are_refreshed_when_expired():
+    auth = FakeAuth(lifetime=-1)
+    manager = _manager(auth)
+    assert manager.cookies == {'session': '1'}
+    assert manager.cookies == {'session': '2'}
+
+
+def test_snapshot_never_refreshes():
+    auth = FakeAuth()
+    manager = _manager(auth)
+    assert manager.snapshot() == ({}, 0)
+    assert auth.calls == 0